@@ -0,0 +1,99 @@
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import islice
+from operator import itemgetter
+
+from recipes.models import Ingredient
+
+GRAM_SIZE = 3
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def normalize(value):
+    return value.lower()
+
+
+def contains(positions, position):
+    index = bisect_left(positions, position)
+    return index < len(positions) and positions[index] == position
+
+
+def get_grams(key):
+    return {key[i:i + GRAM_SIZE] for i in range(len(key) - GRAM_SIZE + 1)}
+
+
+class IngredientIndex:
+    """Индекс для автодополнения названий ингредиентов
+
+    Названия хранятся в отсортированном списке: совпадения по началу
+    названия находятся бинарным поиском, а вхождения в середину - по
+    спискам позиций триграмм. Запросы короче триграммы ищутся только
+    по началу названия. Ингредиенты передаются в порядке id.
+    """
+
+    def __init__(self, ingredients):
+        entries = sorted(
+            ((normalize(ingredient['name']), ingredient)
+             for ingredient in ingredients),
+            key=itemgetter(0)
+        )
+        self.keys = [key for key, _ in entries]
+        self.ingredients = [ingredient for _, ingredient in entries]
+        postings = defaultdict(list)
+        for position, key in enumerate(self.keys):
+            for gram in get_grams(key):
+                postings[gram].append(position)
+        self.postings = {
+            gram: array('I', positions)
+            for gram, positions in postings.items()
+        }
+
+    @classmethod
+    def build(cls):
+        return cls(
+            Ingredient.objects.values(
+                'id', 'name', 'measurement_unit'
+            ).order_by('id')
+        )
+
+    def find_prefixed(self, query):
+        position = bisect_left(self.keys, query)
+        while (position < len(self.keys)
+               and self.keys[position].startswith(query)):
+            yield position
+            position += 1
+
+    def find_candidates(self, query):
+        grams = get_grams(query)
+        lists = sorted(
+            (self.postings.get(gram, ()) for gram in grams), key=len
+        )
+        return (
+            position for position in lists[0]
+            if all(contains(positions, position) for positions in lists[1:])
+        )
+
+    def find_contained(self, query):
+        for position in self.find_candidates(query):
+            key = self.keys[position]
+            if query in key and not key.startswith(query):
+                yield position
+
+    def search(self, query, limit=None):
+        """Ингредиенты, начинающиеся с query, затем содержащие его
+
+        Без limit возвращается не больше DEFAULT_LIMIT ингредиентов,
+        limit больше MAX_LIMIT уменьшается до MAX_LIMIT.
+        """
+        query = normalize(query)
+        limit = DEFAULT_LIMIT if limit is None else min(limit, MAX_LIMIT)
+        positions = islice(self.find_prefixed(query), limit)
+        found = [self.ingredients[position] for position in positions]
+        if len(found) < limit and len(query) >= GRAM_SIZE:
+            found.extend(
+                self.ingredients[position] for position
+                in islice(self.find_contained(query), limit - len(found))
+            )
+        return found
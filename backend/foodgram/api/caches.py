@@ -0,0 +1,113 @@
+from threading import Lock, Thread
+from time import time
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import connection
+
+from recipes.models import Tag
+from .serializers import TagsSerializer
+
+CATALOG_VERSION = 'catalog'
+INGREDIENTS_VERSION = 'ingredients'
+POPULARITY_VERSION = 'popularity'
+RECIPES_VERSION = 'recipes'
+RELATIONS_VERSION = 'relations:{}'
+TAGS_VERSION = 'tags'
+
+
+def get_version(name):
+    """Текущая версия данных из общего кеша Django"""
+    key = f'cache-version:{name}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def get_modified(name):
+    """Время последнего изменения данных для заголовка Last-Modified
+
+    Если время вытеснено из кеша, изменением считается текущий момент.
+    """
+    key = f'cache-modified:{name}'
+    modified = cache.get(key)
+    if modified is None:
+        cache.add(key, time(), None)
+        modified = cache.get(key)
+    return modified
+
+
+def bump_version(name):
+    """Меняет версию данных, сбрасывая их кеши во всех процессах"""
+    cache.set_many({
+        f'cache-version:{name}': uuid4().hex,
+        f'cache-modified:{name}': time(),
+    }, None)
+
+
+class VersionedCache:
+    """Кеш значения в памяти процесса, привязанный к версии данных
+
+    Значение пересобирается функцией build, только когда версия в общем
+    кеше Django отличается от той, с которой оно было собрано. С stale=True
+    после смены версии запросы получают прежнее значение, пока новое
+    собирается в фоновом потоке: сборка не задерживает ответы.
+    """
+
+    def __init__(self, name, build, stale=False):
+        self.name = name
+        self.build = build
+        self.stale = stale
+        self.entry = (None, None)
+        self.lock = Lock()
+
+    def get(self):
+        version = get_version(self.name)
+        cached_version, value = self.entry
+        if cached_version == version:
+            return value
+        if self.stale and cached_version is not None:
+            if self.lock.acquire(blocking=False):
+                Thread(
+                    target=self.rebuild, args=(version,), daemon=True
+                ).start()
+            return value
+        with self.lock:
+            cached_version, value = self.entry
+            if cached_version != version:
+                value = self.build()
+                self.entry = (version, value)
+        return value
+
+    def rebuild(self, version):
+        """Собирает значение в фоновом потоке, захватившем lock"""
+        try:
+            self.entry = (version, self.build())
+        finally:
+            connection.close()
+            self.lock.release()
+
+    def clear(self):
+        """Забывает значение: следующий get соберет его сразу"""
+        with self.lock:
+            self.entry = (None, None)
+
+
+def load_tags():
+    return list(TagsSerializer(Tag.objects.all(), many=True).data)
+
+
+tag_catalog = VersionedCache(TAGS_VERSION, load_tags)
+
+
+def get_tag_choices():
+    """Варианты фильтра по тегам из кеша тегов"""
+    return [(tag['slug'], tag['slug']) for tag in tag_catalog.get()]
+
+
+def get_tag_ids(slugs):
+    """Идентификаторы тегов по слагам из кеша тегов"""
+    slugs = set(slugs)
+    return [tag['id'] for tag in tag_catalog.get() if tag['slug'] in slugs]
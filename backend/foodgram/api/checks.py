@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core import checks
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Версии кешей API должны храниться в общем для процессов кеше"""
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.DEBUG or backend not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [checks.Warning(
+        f'Кеш по умолчанию {backend} не общий для процессов: изменения '
+        'тегов, ингредиентов и рецептов не дойдут до других процессов.',
+        hint='Укажите CACHE_BACKEND и CACHE_LOCATION общего кеша, '
+             'например memcached из infra/docker-compose.yml.',
+        id='api.W001',
+    )]
@@ -0,0 +1,55 @@
+from functools import wraps
+from hashlib import md5
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .caches import RELATIONS_VERSION, bump_version, get_modified, get_version
+from .renderers import FastJSONRenderer
+
+
+def make_etag(*parts):
+    return '"{}"'.format(md5(':'.join(map(str, parts)).encode()).hexdigest())
+
+
+def get_user_validators(request):
+    """Версия и время изменения избранного, корзины и подписок"""
+    if not request.user.is_authenticated:
+        return '', 0
+    name = RELATIONS_VERSION.format(request.user.id)
+    return get_version(name), get_modified(name)
+
+
+def bump_user_relations(user_id):
+    """Отмечает изменение избранного, корзины или подписок пользователя"""
+    bump_version(RELATIONS_VERSION.format(user_id))
+
+
+def conditional(get_validators):
+    """Отвечает 304, если ответ не изменился с версии клиента
+
+    get_validators(request, *args, **kwargs) возвращает ETag и время
+    изменения ответа или None, если проверить ответ нельзя. Проверка
+    выполняется до сериализации, ответ строится только при изменениях.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            validators = None
+            if request.accepted_media_type == FastJSONRenderer.media_type:
+                validators = get_validators(request, *args, **kwargs)
+            if validators is None:
+                return method(view, request, *args, **kwargs)
+            etag, last_modified = validators
+            last_modified = int(last_modified)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = method(view, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                response['Last-Modified'] = http_date(last_modified)
+            return response
+        return wrapper
+    return decorator
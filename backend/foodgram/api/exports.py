@@ -0,0 +1,122 @@
+import csv
+from io import BytesIO
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+from rest_framework.negotiation import DefaultContentNegotiation
+
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_CHUNK_SIZE = 64 * 1024
+
+
+class ExportContentNegotiation(DefaultContentNegotiation):
+    """Согласование рендерера без учета параметра format
+
+    В выгрузках параметр format выбирает формат файла, поэтому ответы
+    с ошибками отдаются обычными рендерерами API.
+    """
+
+    def filter_renderers(self, renderers, format):
+        return renderers
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListExport:
+    """Базовый формат выгрузки списка покупок
+
+    Строки списка - кортежи (название, единица измерения, количество).
+    """
+    content_type = None
+    extension = None
+
+    def stream(self, items):
+        raise NotImplementedError
+
+
+class TextShoppingListExport(ShoppingListExport):
+    """Выгрузка списка покупок в текстовом виде"""
+    content_type = 'text/plain'
+    extension = 'txt'
+
+    def stream(self, items):
+        separator = ''
+        for name, measurement_unit, amount in items:
+            yield f'{separator}{name} - {amount}{measurement_unit}'.encode()
+            separator = '\n'
+
+
+class CSVShoppingListExport(ShoppingListExport):
+    """Выгрузка списка покупок в CSV"""
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def stream(self, items):
+        writer = csv.writer(Echo())
+        yield '\ufeff'.encode()
+        yield writer.writerow(
+            ('Ингредиент', 'Количество', 'Единица измерения')
+        ).encode()
+        for name, measurement_unit, amount in items:
+            yield writer.writerow((name, amount, measurement_unit)).encode()
+
+
+class PDFShoppingListExport(ShoppingListExport):
+    """Выгрузка списка покупок в PDF
+
+    Таблица перекрестных ссылок PDF пишется в конце файла, поэтому
+    документ собирается целиком и затем отдается частями.
+    """
+    content_type = 'application/pdf'
+    extension = 'pdf'
+    font_size = 12
+    leading = 18
+    margin = 50
+
+    @staticmethod
+    def register_font():
+        if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_FONT)
+            )
+
+    def stream(self, items):
+        self.register_font()
+        buffer = BytesIO()
+        _, height = A4
+        canvas = Canvas(buffer, pagesize=A4)
+        canvas.setTitle('Список покупок')
+        canvas.setFont(PDF_FONT_NAME, self.font_size + 4)
+        canvas.drawString(self.margin, height - self.margin, 'Список покупок')
+        canvas.setFont(PDF_FONT_NAME, self.font_size)
+        y = height - self.margin - 2 * self.leading
+        for name, measurement_unit, amount in items:
+            if y < self.margin:
+                canvas.showPage()
+                canvas.setFont(PDF_FONT_NAME, self.font_size)
+                y = height - self.margin
+            canvas.drawString(
+                self.margin, y, f'• {name} - {amount} {measurement_unit}'
+            )
+            y -= self.leading
+        canvas.save()
+        buffer.seek(0)
+        yield from iter(lambda: buffer.read(PDF_CHUNK_SIZE), b'')
+
+
+SHOPPING_LIST_EXPORTS = {
+    export.extension: export
+    for export in (
+        TextShoppingListExport,
+        CSVShoppingListExport,
+        PDFShoppingListExport,
+    )
+}
@@ -1,32 +1,81 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import Exists, F, FloatField, OuterRef
+from django.db.models.functions import Cast
 from django_filters.rest_framework import FilterSet, filters
 from django_filters.widgets import BooleanWidget
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import SEARCH_CONFIG, Ingredient, Recipe
+from .caches import get_tag_choices, get_tag_ids
 
 
 class RecipeFilter(FilterSet):
     """Фильтр для модели Recipe"""
 
-    TAG_CHOICES = tuple([(tag.slug, tag.slug) for tag in Tag.objects.all()])
-
     tags = filters.MultipleChoiceFilter(
-        field_name='tags__slug', choices=TAG_CHOICES
+        field_name='tags__slug', choices=get_tag_choices,
+        method='filter_tags'
     )
     author = filters.CharFilter(field_name='author__id')
     is_favorited = filters.BooleanFilter(
-        field_name='is_favorited', widget=BooleanWidget()
+        method='filter_is_favorited', widget=BooleanWidget()
     )
     is_in_shopping_cart = filters.BooleanFilter(
-        field_name='is_in_shopping_cart', widget=BooleanWidget()
+        method='filter_is_in_shopping_cart', widget=BooleanWidget()
+    )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'popular'), ('trending', 'trending')),
+        method='filter_ordering'
     )
 
+    ORDERING_FIELDS = {
+        'popular': 'favorites_count',
+        'trending': 'trending_score',
+    }
+
     class Meta:
         model = Recipe
         fields = (
             'is_favorited', 'is_in_shopping_cart',
-            'author', 'tags'
+            'author', 'tags', 'search', 'ordering'
         )
 
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'), tag_id__in=get_tag_ids(value)
+        )))
+
+    def filter_by_user(self, queryset, lookup, value):
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none() if value else queryset
+        if value:
+            return queryset.filter(**{lookup: user})
+        return queryset.exclude(**{lookup: user})
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_by_user(queryset, 'users_favorite__user', value)
+
+    def filter_is_in_shopping_cart(self, queryset, name, value):
+        return self.filter_by_user(
+            queryset, 'users_shopping_cart__user', value
+        )
+
+    def filter_search(self, queryset, name, value):
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        # ts_rank возвращает real: приведение к double precision нужно,
+        # чтобы ранг из курсора пагинации точно совпадал со значением в базе
+        return queryset.filter(search_vector=query).annotate(rank=Cast(
+            SearchRank(F('search_vector'), query), FloatField()
+        )).order_by('-rank', *Recipe._meta.ordering)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(f'-{self.ORDERING_FIELDS[value]}', 'id')
+
 
 class IngredientFilter(FilterSet):
     name = filters.CharFilter(
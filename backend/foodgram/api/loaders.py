@@ -0,0 +1,74 @@
+from collections import defaultdict
+
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils.functional import cached_property
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow
+
+
+class UserRelationsLoader:
+    """Связи текущего пользователя, загружаемые один раз за запрос"""
+
+    def __init__(self, user):
+        self.user = user
+
+    def _load_ids(self, model, field):
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(
+            model.objects.filter(user=self.user).order_by().values_list(
+                field, flat=True
+            )
+        )
+
+    @cached_property
+    def followed_author_ids(self):
+        return self._load_ids(Follow, 'author_id')
+
+    @cached_property
+    def favorite_recipe_ids(self):
+        return self._load_ids(Favorite, 'recipe_id')
+
+    @cached_property
+    def cart_recipe_ids(self):
+        return self._load_ids(ShoppingCart, 'recipe_id')
+
+
+def get_relations(request):
+    """Возвращает загрузчик связей, привязанный к запросу"""
+    relations = getattr(request, '_user_relations', None)
+    if relations is None:
+        relations = UserRelationsLoader(request.user)
+        request._user_relations = relations
+    return relations
+
+
+def load_recipes_preview(authors, limit=None):
+    """Подгружает авторам первые limit рецептов одним запросом"""
+    authors = list(authors)
+    if not authors:
+        return authors
+    recipes = Recipe.objects.filter(author__in=authors)
+    if limit is not None:
+        ranked = recipes.annotate(
+            author_position=Window(
+                expression=RowNumber(),
+                partition_by=F('author_id'),
+                order_by=(F('name').asc(), F('id').asc()),
+            )
+        )
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) AS ranked '
+            'WHERE ranked.author_position <= %s '
+            'ORDER BY ranked.author_id, ranked.author_position',
+            (*params, limit)
+        )
+    previews = defaultdict(list)
+    for recipe in recipes:
+        previews[recipe.author_id].append(recipe)
+    for author in authors:
+        author.recipes_preview = previews[author.id]
+    return authors
@@ -0,0 +1,168 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Follow, User
+
+SEED_PREFIX = 'audit-indexes'
+
+
+class SeedRollbackError(Exception):
+    """Откатывает транзакцию с тестовыми данными"""
+
+
+def seed(recipes_count):
+    """Заполняет базу тестовыми данными для проверки планов запросов"""
+    rnd = random.Random(0)
+    users = User.objects.bulk_create([
+        User(username=f'{SEED_PREFIX}-{i}', email=f'{SEED_PREFIX}-{i}@x.ru')
+        for i in range(max(recipes_count // 50, 2))
+    ])
+    tags = Tag.objects.bulk_create([
+        Tag(name=f'Тег {i}', slug=f'{SEED_PREFIX}-{i}') for i in range(8)
+    ])
+    ingredients = Ingredient.objects.bulk_create([
+        Ingredient(name=f'{SEED_PREFIX} {i}', measurement_unit='г')
+        for i in range(max(recipes_count // 20, 10))
+    ])
+    recipes = Recipe.objects.bulk_create([
+        Recipe(name=f'{SEED_PREFIX} {i}', author=rnd.choice(users),
+               text='Описание', image='recipes/seed.png', cooking_time=10)
+        for i in range(recipes_count)
+    ], batch_size=1000)
+    Recipe.tags.through.objects.bulk_create([
+        Recipe.tags.through(recipe=recipe, tag=tag)
+        for recipe in recipes for tag in rnd.sample(tags, 2)
+    ], batch_size=1000)
+    IngredientInRecipe.objects.bulk_create([
+        IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+        for recipe in recipes for ingredient in rnd.sample(ingredients, 5)
+    ], batch_size=1000)
+    for model in (Favorite, ShoppingCart):
+        model.objects.bulk_create([
+            model(user=user, recipe=recipe)
+            for user in users for recipe in rnd.sample(recipes, 5)
+        ], batch_size=1000)
+    Follow.objects.bulk_create([
+        Follow(user=user, author=author)
+        for user in users for author in rnd.sample(users, 2)
+        if author != user
+    ], batch_size=1000)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def get_endpoints(user, recipe, tags):
+    """Адреса, запросы которых проверяются"""
+    tag_params = '&'.join(f'tags={tag.slug}' for tag in tags)
+    return (
+        '/api/recipes/',
+        '/api/recipes/?cursor=',
+        f'/api/recipes/?author={recipe.author_id}',
+        f'/api/recipes/?{tag_params}',
+        '/api/recipes/?is_favorited=1',
+        '/api/recipes/?is_in_shopping_cart=1',
+        f'/api/recipes/{recipe.id}/',
+        f'/api/recipes/{recipe.id}/similar/',
+        '/api/recipes/download_shopping_cart/',
+        '/api/users/',
+        f'/api/users/{user.id}/',
+        '/api/users/subscriptions/?recipes_limit=3',
+    )
+
+
+def iter_plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from iter_plan_nodes(child)
+
+
+def find_seq_scans(sql, table_rows, min_rows):
+    """Последовательные чтения больших таблиц в плане запроса"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return [
+        node['Relation Name'] for node in iter_plan_nodes(plan[0]['Plan'])
+        if node['Node Type'] == 'Seq Scan'
+        and table_rows.get(node['Relation Name'], 0) >= min_rows
+    ]
+
+
+def get_table_rows():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname, reltuples FROM pg_class WHERE relkind = 'r'"
+        )
+        return dict(cursor.fetchall())
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN для запросов основных адресов API и отмечает '
+        'последовательные чтения больших таблиц'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=0, metavar='RECIPES',
+            help='Заполнить базу тестовыми рецептами на время проверки '
+                 '(данные удаляются после нее)'
+        )
+        parser.add_argument(
+            '--min-rows', type=int, default=10000,
+            help='Размер таблицы, начиная с которого отмечается Seq Scan'
+        )
+
+    def audit(self, min_rows):
+        user = User.objects.order_by('id').last()
+        recipe = Recipe.objects.order_by('id').last()
+        if user is None or recipe is None:
+            raise CommandError('Нет пользователей или рецептов для проверки')
+        table_rows = get_table_rows()
+        client = APIClient()
+        client.force_authenticate(user)
+        problems = 0
+        for url in get_endpoints(user, recipe, Tag.objects.all()[:2]):
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(url)
+            self.stdout.write(f'{url} - {response.status_code}')
+            for query in context.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                for table in find_seq_scans(query['sql'], table_rows,
+                                            min_rows):
+                    problems += 1
+                    self.stdout.write(self.style.WARNING(
+                        f'  Seq Scan {table}: {query["sql"][:200]}'
+                    ))
+        return problems
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Проверка планов доступна только в PostgreSQL')
+        with override_settings(ALLOWED_HOSTS=['*']):
+            try:
+                with transaction.atomic():
+                    if options['seed']:
+                        seed(options['seed'])
+                    problems = self.audit(options['min_rows'])
+                    if options['seed']:
+                        raise SeedRollbackError
+            except SeedRollbackError:
+                pass
+        if problems:
+            raise CommandError(
+                f'Найдено последовательных чтений больших таблиц: {problems}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Последовательных чтений больших таблиц не найдено'
+        ))
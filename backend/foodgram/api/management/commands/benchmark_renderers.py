@@ -0,0 +1,88 @@
+import json
+from time import process_time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from api.renderers import FastJSONRenderer, orjson
+from recipes.models import Ingredient, Recipe
+from users.models import User
+
+
+def get_endpoints(recipe, ingredient):
+    return (
+        '/api/recipes/?limit=100',
+        f'/api/recipes/{recipe.id}/',
+        f'/api/recipes/cook/?ingredients={ingredient.id}&limit=100',
+        '/api/tags/',
+        '/api/ingredients/',
+        '/api/users/?limit=100',
+        '/api/users/subscriptions/?recipes_limit=3&limit=100',
+    )
+
+
+def measure(render, data, repeat):
+    """Лучшее время процессора на одну сериализацию из repeat"""
+    best = None
+    for _ in range(repeat):
+        started = process_time()
+        render(data)
+        elapsed = process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return max(best, 1e-9)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время сериализации ответов основных адресов API '
+        'стандартным JSONRenderer и FastJSONRenderer'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Сколько раз повторить замер для каждого адреса'
+        )
+
+    def get_responses(self):
+        user = User.objects.order_by('id').last()
+        recipe = Recipe.objects.order_by('id').last()
+        ingredient = Ingredient.objects.order_by('id').last()
+        if user is None or recipe is None or ingredient is None:
+            raise CommandError('Нет пользователей или рецептов для замера')
+        client = APIClient()
+        client.force_authenticate(user)
+        for url in get_endpoints(recipe, ingredient):
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(f'{url} - {response.status_code}')
+            data = getattr(response, 'data', None)
+            if data is None:
+                data = json.loads(response.content)
+            yield url, data
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING(
+                'orjson не установлен, используется стандартный json'
+            ))
+        renderers = (
+            ('json', JSONRenderer().render),
+            ('orjson', FastJSONRenderer().render),
+        )
+        with override_settings(ALLOWED_HOSTS=['*']):
+            responses = list(self.get_responses())
+        for url, data in responses:
+            size = len(JSONRenderer().render(data))
+            timings = [
+                measure(render, data, options['repeat'])
+                for _, render in renderers
+            ]
+            self.stdout.write(
+                f'{url} ({size // 1024} КБ): ' + ', '.join(
+                    f'{name} {elapsed * 1000:.2f} мс'
+                    for (name, _), elapsed in zip(renderers, timings)
+                ) + f', ускорение {timings[0] / timings[1]:.1f}x'
+            )
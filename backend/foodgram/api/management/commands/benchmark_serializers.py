@@ -0,0 +1,73 @@
+from time import process_time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+
+from api.representations import build_recipe_bodies
+from api.serializers import RecipeBodySerializer
+from recipes.models import IngredientInRecipe, Recipe
+
+
+def load_recipes(limit):
+    return list(Recipe.objects.select_related('author')[:limit])
+
+
+def serialize_drf(limit):
+    recipes = Recipe.objects.select_related('author').prefetch_related(
+        Prefetch(
+            'ingredients',
+            queryset=IngredientInRecipe.objects.select_related('ingredient')
+        ),
+        'tags',
+    )[:limit]
+    return RecipeBodySerializer(recipes, many=True).data
+
+
+def serialize_fast(limit):
+    return build_recipe_bodies(load_recipes(limit))
+
+
+def measure(serialize, limit, repeat):
+    """Лучшее время процессора на один прогон из repeat"""
+    best = None
+    for _ in range(repeat):
+        started = process_time()
+        serialize(limit)
+        elapsed = process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return max(best, 1e-6)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает производительность RecipeBodySerializer '
+        'и build_recipe_bodies'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=1000,
+            help='Сколько рецептов сериализовать за прогон'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Сколько раз повторить замер'
+        )
+
+    def handle(self, *args, **options):
+        limit, repeat = options['limit'], options['repeat']
+        count = Recipe.objects.all()[:limit].count()
+        if not count:
+            raise CommandError('Нет рецептов для замера')
+        results = {}
+        for name, serialize in (('DRF', serialize_drf),
+                                ('build_recipe_bodies', serialize_fast)):
+            results[name] = measure(serialize, limit, repeat)
+            self.stdout.write(
+                f'{name}: {count / results[name]:.0f} рецептов/с на ядро'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Ускорение: {:.1f}x'.format(
+                results['DRF'] / results['build_recipe_bodies']
+            )
+        ))
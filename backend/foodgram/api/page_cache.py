@@ -0,0 +1,82 @@
+from functools import wraps
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .caches import CATALOG_VERSION, get_version
+from .renderers import FastJSONRenderer
+
+PAGE_CACHE_STATS = ('hits', 'misses')
+
+
+def get_page_key(request):
+    """Ключ кеша страницы по адресу с упорядоченными параметрами запроса"""
+    query = urlencode(sorted(
+        (key, sorted(values)) for key, values in request.query_params.lists()
+    ), doseq=True)
+    url = f'{request.build_absolute_uri(request.path)}?{query}'
+    return 'recipe-page:{}:{}'.format(
+        get_version(CATALOG_VERSION), md5(url.encode()).hexdigest()
+    )
+
+
+def get_stat_key(name):
+    return f'recipe-page-cache:{name}'
+
+
+def record_stat(name):
+    key = get_stat_key(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_stats():
+    """Число попаданий и промахов кеша страниц"""
+    values = cache.get_many([get_stat_key(name) for name in PAGE_CACHE_STATS])
+    return {
+        name: values.get(get_stat_key(name), 0) for name in PAGE_CACHE_STATS
+    }
+
+
+def reset_stats():
+    cache.delete_many([get_stat_key(name) for name in PAGE_CACHE_STATS])
+
+
+def cache_anonymous_page(method):
+    """Кеширует готовый JSON ответа для анонимных пользователей
+
+    Ключ включает версию каталога рецептов, которую меняет любое
+    изменение рецептов, поэтому устаревшие страницы не читаются.
+    """
+    @wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        if (request.user.is_authenticated or request.accepted_media_type
+                != FastJSONRenderer.media_type):
+            return method(view, request, *args, **kwargs)
+        key = get_page_key(request)
+        content = cache.get(key)
+        if content is not None:
+            record_stat('hits')
+            response = HttpResponse(
+                content, content_type=FastJSONRenderer.media_type
+            )
+            response['X-Cache'] = 'HIT'
+            return response
+        record_stat('misses')
+        response = method(view, request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        content = FastJSONRenderer().render(response.data)
+        cache.set(key, content, settings.RECIPE_PAGE_CACHE_TTL)
+        response = HttpResponse(
+            content, content_type=FastJSONRenderer.media_type
+        )
+        response['X-Cache'] = 'MISS'
+        return response
+    return wrapper
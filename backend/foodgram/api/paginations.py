@@ -1,5 +1,291 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from collections import OrderedDict
+from base64 import b64decode, b64encode
+from binascii import Error as Base64Error
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def get_count_query(queryset):
+    """Запрос для подсчета строк без аннотаций, не влияющих на их число"""
+    query = queryset.query.chain()
+    query.clear_ordering(force_empty=True)
+    query.select_related = False
+    query.annotations = {
+        alias: annotation
+        for alias, annotation in query.annotations.items()
+        if annotation.contains_aggregate
+    }
+    query._annotation_select_cache = None
+    return query
+
+
+def estimate_count(query, using):
+    """Оценка числа строк планировщиком PostgreSQL"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    try:
+        sql, params = query.get_compiler(using).as_sql()
+    except EmptyResultSet:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedPage(Page):
+    """Страница, о следующей странице которой известно по выборке"""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор, оценивающий число записей в больших выборках
+
+    Точный COUNT(*) выполняется, только если выборка меньше порога
+    PAGINATION_COUNT_THRESHOLD. Для больших выборок используется оценка
+    планировщика PostgreSQL, а на других СУБД - точный результат,
+    закешированный на PAGINATION_COUNT_CACHE_TTL секунд. С неточным
+    числом записей номер страницы с ним не сверяется, а наличие
+    следующей страницы определяется выборкой на одну запись больше.
+    """
+    count_is_exact = True
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return len(self.object_list)
+        using = self.object_list.db
+        query = get_count_query(self.object_list)
+        threshold = settings.PAGINATION_COUNT_THRESHOLD
+        estimate = estimate_count(query, using)
+        if estimate is not None and estimate >= threshold:
+            self.count_is_exact = False
+            return estimate
+        try:
+            sql, params = query.get_compiler(using).as_sql()
+        except EmptyResultSet:
+            return 0
+        key = 'pagination-count:' + md5(
+            f'{using}:{sql}:{params}'.encode()
+        ).hexdigest()
+        count = cache.get(key)
+        if count is not None:
+            self.count_is_exact = False
+            return count
+        count = query.get_count(using)
+        if count >= threshold:
+            cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TTL)
+        return count
+
+    def validate_number(self, number):
+        if self.count and self.count_is_exact:
+            return super().validate_number(number)
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(_('That page number is not an integer'))
+        if number < 1:
+            raise EmptyPage(_('That page number is less than 1'))
+        return number
+
+    def page(self, number):
+        if self.count and self.count_is_exact:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(
+            self.object_list[bottom:bottom + self.per_page + 1]
+        )
+        if not object_list and number > 1:
+            raise EmptyPage(_('That page contains no results'))
+        return EstimatedPage(
+            object_list[:self.per_page], number, self,
+            len(object_list) > self.per_page
+        )
+
+
+class KeysetPagination(CursorPagination):
+    """Пагинация по ключу сортировки без OFFSET и COUNT
+
+    Курсор хранит значения полей сортировки последней (или первой)
+    записи страницы, поэтому любая страница выбирается по индексу
+    так же быстро, как первая.
+    """
+    page_size_query_param = 'limit'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def get_keyset_ordering(self, queryset):
+        ordering = list(
+            queryset.query.order_by or queryset.model._meta.ordering
+        )
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering.append('id')
+        return [
+            (field.lstrip('-'), field.startswith('-')) for field in ordering
+        ]
+
+    @staticmethod
+    def get_ordering_field(queryset, name):
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        if name == 'pk':
+            return queryset.model._meta.pk
+        return queryset.model._meta.get_field(name)
+
+    def decode_keyset(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(b64decode(encoded.encode('ascii')))
+            values, reverse = cursor['v'], bool(cursor['r'])
+        except (Base64Error, UnicodeError, ValueError, KeyError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            values = [
+                self.get_ordering_field(queryset, field).to_python(value)
+                for (field, _), value in zip(self.ordering, values)
+            ]
+        except (ValidationError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in values:
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def encode_keyset(self, obj, reverse):
+        values = [getattr(obj, field) for field, _ in self.ordering]
+        cursor = json.dumps({'v': values, 'r': int(reverse)}, default=str)
+        encoded = b64encode(cursor.encode()).decode('ascii')
+        url = remove_query_param(self.base_url, 'page')
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def build_keyset_filter(self, values, reverse):
+        condition = Q()
+        equal = Q()
+        for (field, descending), value in zip(self.ordering, values):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.ordering = self.get_keyset_ordering(queryset)
+        values, self.reverse = self.decode_keyset(request, queryset)
+        queryset = queryset.order_by(*(
+            f'-{field}' if descending != self.reverse else field
+            for field, descending in self.ordering
+        ))
+        if values is not None:
+            queryset = queryset.filter(
+                self.build_keyset_filter(values, self.reverse)
+            )
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return replace_query_param(
+                self.base_url, self.cursor_query_param, ''
+            )
+        return self.encode_keyset(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return replace_query_param(
+                self.base_url, self.cursor_query_param, ''
+            )
+        return self.encode_keyset(self.page[0], reverse=True)
 
 
 class CustomPageNumberRagination(PageNumberPagination):
+    """Постраничная пагинация с переходом на курсор по запросу
+
+    Если в запросе есть параметр cursor (в том числе пустой, для первой
+    страницы), страницы выбираются по ключу сортировки через
+    KeysetPagination.
+    """
     page_size_query_param = 'limit'
+    django_paginator_class = EstimatedCountPaginator
+    keyset_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if isinstance(queryset, QuerySet) and (
+                self.keyset_pagination_class.cursor_query_param
+                in request.query_params):
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('count_is_exact', self.page.paginator.count_is_exact),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_is_exact'] = {
+            'type': 'boolean',
+        }
+        return response_schema
+
+    def get_html_context(self):
+        if self.keyset is not None:
+            return self.keyset.get_html_context()
+        return super().get_html_context()
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            *super().get_schema_operation_parameters(view),
+            self.keyset_pagination_class().get_schema_operation_parameters(
+                view
+            )[0],
+        ]
@@ -0,0 +1,104 @@
+import numpy as np
+
+from recipes.models import IngredientInRecipe, Recipe
+
+MAX_INGREDIENT_ID = int(np.iinfo(np.int64).max)
+
+
+class RecipeMatches:
+    """Найденные рецепты, отсортированные по покрытию ингредиентами
+
+    Элементы - кортежи (id рецепта, доля имеющихся ингредиентов, число
+    недостающих ингредиентов).
+    """
+
+    def __init__(self, recipe_ids, coverage, missing):
+        self.recipe_ids = recipe_ids
+        self.coverage = coverage
+        self.missing = missing
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def __getitem__(self, index):
+        return list(zip(
+            self.recipe_ids[index].tolist(),
+            self.coverage[index].tolist(),
+            self.missing[index].tolist(),
+        ))
+
+
+class RecipeIngredientIndex:
+    """Обратный индекс ингредиент -> рецепты для подбора по продуктам
+
+    Рецепты пронумерованы в порядке сортировки по названию. Номера
+    рецептов с одним ингредиентом лежат в positions подряд, начиная
+    с starts[i] для i-го ингредиента из ingredient_ids.
+    """
+
+    def __init__(self, recipe_ids, links):
+        self.recipe_ids = np.array(recipe_ids, dtype=np.int64)
+        numbers = {
+            recipe_id: number for number, recipe_id in enumerate(recipe_ids)
+        }
+        links = [
+            (ingredient_id, numbers[recipe_id])
+            for recipe_id, ingredient_id in links if recipe_id in numbers
+        ]
+        ingredient_ids = np.array(
+            [ingredient_id for ingredient_id, _ in links], dtype=np.int64
+        )
+        positions = np.array(
+            [number for _, number in links], dtype=np.int32
+        )
+        order = np.argsort(ingredient_ids, kind='stable')
+        self.ingredient_ids, starts = np.unique(
+            ingredient_ids[order], return_index=True
+        )
+        self.starts = np.append(starts, len(order))
+        self.positions = positions[order]
+        self.sizes = np.bincount(positions, minlength=len(recipe_ids))
+
+    @classmethod
+    def build(cls):
+        return cls(
+            list(Recipe.objects.values_list('id', flat=True)),
+            IngredientInRecipe.objects.values_list(
+                'recipe_id', 'ingredient_id'
+            ).order_by().iterator(),
+        )
+
+    def get_postings(self, ingredient_ids):
+        ingredient_ids = np.unique(np.array(ingredient_ids, dtype=np.int64))
+        indexes = np.searchsorted(self.ingredient_ids, ingredient_ids)
+        indexes = indexes[indexes < len(self.ingredient_ids)]
+        indexes = indexes[
+            np.isin(self.ingredient_ids[indexes], ingredient_ids)
+        ]
+        return [
+            self.positions[self.starts[index]:self.starts[index + 1]]
+            for index in indexes
+        ]
+
+    def search(self, ingredient_ids):
+        """Рецепты, в которых есть хотя бы один из ингредиентов
+
+        Сначала идут рецепты с наибольшей долей имеющихся ингредиентов,
+        затем с наименьшим числом недостающих, затем по названию.
+        """
+        postings = self.get_postings(ingredient_ids)
+        if not postings:
+            empty = np.array([], dtype=np.int64)
+            return RecipeMatches(empty, empty.astype(float), empty)
+        present = np.bincount(
+            np.concatenate(postings), minlength=len(self.recipe_ids)
+        )
+        found = np.flatnonzero(present)
+        present = present[found]
+        sizes = self.sizes[found]
+        coverage = present / sizes
+        missing = sizes - present
+        order = np.lexsort((found, missing, -coverage))
+        return RecipeMatches(
+            self.recipe_ids[found[order]], coverage[order], missing[order]
+        )
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .caches import INGREDIENTS_VERSION, TAGS_VERSION, get_version
+from .loaders import get_relations
+from .representations import build_recipe_bodies
+
+RECIPE_BODY_FORMAT = 1
+
+
+def get_body_keys(recipes):
+    """Ключи кеша тел рецептов
+
+    Ключ включает время изменения рецепта и версии тегов и ингредиентов,
+    поэтому тело, собранное по данным до изменения, ложится под ключ,
+    который после изменения уже никто не читает.
+    """
+    prefix = 'recipe-body:{}:{}:{}'.format(
+        RECIPE_BODY_FORMAT,
+        get_version(TAGS_VERSION),
+        get_version(INGREDIENTS_VERSION),
+    )
+    return {
+        recipe.id: f'{prefix}:{recipe.id}:{recipe.updated_at.timestamp()}'
+        for recipe in recipes
+    }
+
+
+def get_bodies(recipes):
+    """Тела рецептов из кеша, недостающие сериализуются и кешируются"""
+    keys = get_body_keys(recipes)
+    cached = cache.get_many(keys.values())
+    missing = [recipe for recipe in recipes if keys[recipe.id] not in cached]
+    if missing:
+        fresh = {
+            keys[recipe.id]: body for recipe, body in zip(
+                missing, build_recipe_bodies(missing)
+            )
+        }
+        cache.set_many(fresh, settings.RECIPE_CACHE_TTL)
+        cached.update(fresh)
+    return [cached[keys[recipe.id]] for recipe in recipes]
+
+
+def render_recipes(recipes, request):
+    """Представления рецептов с флагами текущего пользователя"""
+    relations = get_relations(request)
+    data = []
+    for body in get_bodies(recipes):
+        recipe = dict(body)
+        author = recipe['author'] = dict(body['author'])
+        author['is_subscribed'] = (
+            author['id'] in relations.followed_author_ids
+        )
+        recipe['is_favorited'] = recipe['id'] in relations.favorite_recipe_ids
+        recipe['is_in_shopping_cart'] = (
+            recipe['id'] in relations.cart_recipe_ids
+        )
+        if recipe['image']:
+            recipe['image'] = request.build_absolute_uri(recipe['image'])
+        data.append(recipe)
+    return data
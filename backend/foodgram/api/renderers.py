@@ -0,0 +1,44 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    if orjson else 0
+)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson с тем же результатом, что и у DRF
+
+    Даты, Decimal и прочие типы, которые orjson не сериализует сам или
+    сериализует иначе, передаются в JSONEncoder DRF. Для отступов,
+    нестрогого JSON и данных, с которыми orjson не справился, а также
+    без установленного orjson используется стандартный json.
+    Отличий два, и таких чисел в ответах API нет: очень большие и малые
+    числа с плавающей точкой записываются как 1e-7 вместо 1e-07,
+    а NaN и бесконечности - как null, хотя строгий JSONRenderer на них
+    выдает ValueError.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii
+                or not self.compact or not self.strict
+                or self.get_indent(accepted_media_type,
+                                   renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=ORJSON_OPTIONS
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+                b'\xe2\x80\xa9', b'\\u2029'
+            )
+        return ret
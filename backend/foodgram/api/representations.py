@@ -0,0 +1,82 @@
+from collections import defaultdict
+
+from recipes.models import IngredientInRecipe, Recipe
+from .caches import tag_catalog
+
+INGREDIENT_FIELDS = (
+    'recipe_id', 'ingredient_id', 'ingredient__name',
+    'ingredient__measurement_unit', 'amount',
+)
+
+
+def load_ingredients(recipe_ids):
+    """Ингредиенты рецептов одним запросом, в порядке RecipesSerializer"""
+    ingredients = defaultdict(list)
+    for recipe_id, ingredient_id, name, unit, amount in (
+            IngredientInRecipe.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values_list(*INGREDIENT_FIELDS)):
+        ingredients[recipe_id].append({
+            'id': ingredient_id,
+            'name': name,
+            'measurement_unit': unit,
+            'amount': amount,
+        })
+    return ingredients
+
+
+def load_tags(recipe_ids):
+    """Теги рецептов из кеша тегов, отсортированные по слагу"""
+    catalog = {tag['id']: tag for tag in tag_catalog.get()}
+    positions = {tag_id: position for position, tag_id in enumerate(catalog)}
+    tags = defaultdict(list)
+    for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids).values_list('recipe_id', 'tag_id'):
+        if tag_id in catalog:
+            tags[recipe_id].append(tag_id)
+    return {
+        recipe_id: [
+            dict(catalog[tag_id])
+            for tag_id in sorted(tag_ids, key=positions.__getitem__)
+        ]
+        for recipe_id, tag_ids in tags.items()
+    }
+
+
+def represent_author(user):
+    return {
+        'email': user.email,
+        'id': user.id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'is_subscribed': False,
+    }
+
+
+def build_recipe_bodies(recipes):
+    """Тела рецептов в формате RecipeBodySerializer без полей DRF
+
+    Рецепты должны быть загружены с select_related('author').
+    Ингредиенты и теги читаются двумя запросами values_list.
+    """
+    recipe_ids = [recipe.id for recipe in recipes]
+    ingredients = load_ingredients(recipe_ids)
+    tags = load_tags(recipe_ids)
+    storage = Recipe._meta.get_field('image').storage
+    return [
+        {
+            'id': recipe.id,
+            'tags': tags.get(recipe.id, []),
+            'author': represent_author(recipe.author),
+            'ingredients': ingredients.get(recipe.id, []),
+            'is_favorited': False,
+            'is_in_shopping_cart': False,
+            'name': recipe.name,
+            'image': storage.url(recipe.image.name)
+            if recipe.image else None,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+        }
+        for recipe in recipes
+    ]
@@ -1,13 +1,15 @@
 from django.db import transaction
-from django.shortcuts import get_object_or_404
+from django.db.models import F, Prefetch, prefetch_related_objects
 from djoser.serializers import UserCreateSerializer
 from drf_extra_fields.fields import Base64ImageField
 from drf_writable_nested.serializers import WritableNestedModelSerializer
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
 
-from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
-from users.models import Follow, User
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingListItem, Tag)
+from users.models import User
+from .loaders import get_relations, load_recipes_preview
 
 MIN_VALUE = 1
 
@@ -51,11 +53,8 @@ class UserSerializer(ModelSerializer):
         )
 
     def subscriber(self, obj):
-        user = self.context['request'].user
-        return (
-            user.is_authenticated
-            and Follow.objects.filter(user=user, author=obj).exists()
-        )
+        relations = get_relations(self.context['request'])
+        return obj.id in relations.followed_author_ids
 
 
 class FollowSerializer(UserSerializer):
@@ -75,18 +74,14 @@ class FollowSerializer(UserSerializer):
         )
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get("recipes_limit", None)
-        if limit is not None:
-            recipes = Recipe.objects.filter(author=obj)[:int(limit)]
-        else:
-            recipes = Recipe.objects.filter(author=obj)
+        if not hasattr(obj, 'recipes_preview'):
+            load_recipes_preview([obj], self.context.get('recipes_limit'))
         return RecipesMiniSerializer(
-            recipes, many=True, read_only=True
+            obj.recipes_preview, many=True, read_only=True
         ).data
 
     def get_count_recipes(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
 
 class TagsSerializer(ModelSerializer):
@@ -121,8 +116,8 @@ class RecipesSerializer(ModelSerializer):
     tags = TagsSerializer(many=True)
     author = UserSerializer()
     ingredients = IngredientRecipeAmountSerializer(many=True)
-    is_favorited = serializers.BooleanField(default=False)
-    is_in_shopping_cart = serializers.BooleanField(default=False)
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -132,6 +127,37 @@ class RecipesSerializer(ModelSerializer):
             'name', 'image', 'text', 'cooking_time',
         )
 
+    def get_is_favorited(self, obj):
+        relations = get_relations(self.context['request'])
+        return obj.id in relations.favorite_recipe_ids
+
+    def get_is_in_shopping_cart(self, obj):
+        relations = get_relations(self.context['request'])
+        return obj.id in relations.cart_recipe_ids
+
+
+class RecipeAuthorBodySerializer(UserSerializer):
+    """Автор рецепта без флага подписки текущего пользователя"""
+
+    def subscriber(self, obj):
+        return False
+
+
+class RecipeBodySerializer(RecipesSerializer):
+    """Общая для всех пользователей часть рецепта
+
+    Флаги текущего пользователя и абсолютный адрес картинки подставляются
+    при ответе, поэтому представление можно кешировать. При чтении тела
+    строит build_recipe_bodies, сериалайзер задает их эталонный формат.
+    """
+    author = RecipeAuthorBodySerializer()
+
+    def get_is_favorited(self, obj):
+        return False
+
+    def get_is_in_shopping_cart(self, obj):
+        return False
+
 
 class RecipeCreateUpdateSerializer(WritableNestedModelSerializer):
     """Сериалайзер для создания и обновления рецепта"""
@@ -150,53 +176,65 @@ class RecipeCreateUpdateSerializer(WritableNestedModelSerializer):
         )
 
     def validate(self, data):
-        ingredients = data['ingredients']
+        if 'ingredients' in data:
+            self.check_ingredients(data['ingredients'])
+        if 'tags' in data:
+            data['tags'] = self.check_tags(data['tags'])
+        if 'cooking_time' in data and int(data['cooking_time']) < MIN_VALUE:
+            raise serializers.ValidationError(
+                'Время приготовления не может быть меньше одной минуты'
+            )
+        return data
+
+    def check_ingredients(self, ingredients):
         if not ingredients:
             raise serializers.ValidationError(
                 'Необходимо добавить хотя бы один ингредиент'
             )
-        ingredient_id_list = []
+        ingredient_id_list = [
+            ingredient['ingredient']['id'] for ingredient in ingredients
+        ]
+        if len(ingredient_id_list) != len(set(ingredient_id_list)):
+            raise serializers.ValidationError(
+                'Ингредиент добавлен в рецепт дважды'
+            )
         for ingredient in ingredients:
-            if (not Ingredient.objects.filter(
-                    id=ingredient['ingredient']['id']).exists()):
-                raise serializers.ValidationError(
-                    'Такого ингредиента не существует'
-                )
             if int(ingredient.get('amount')) < MIN_VALUE:
                 raise serializers.ValidationError(
                     'Кол-во ингредиента не может быть меньше единицы'
                 )
-            ingredient_id_list.append(ingredient['ingredient']['id'])
-        if len(ingredient_id_list) != len(set(ingredient_id_list)):
-            raise serializers.ValidationError(
-                'Ингредиент добавлен в рецепт дважды'
-            )
+        ingredient_objects = Ingredient.objects.in_bulk(ingredient_id_list)
+        self.check_missing(
+            ingredient_id_list, ingredient_objects,
+            'Таких ингредиентов не существует'
+        )
+        for ingredient in ingredients:
+            ingredient['ingredient'] = ingredient_objects[
+                ingredient['ingredient']['id']
+            ]
 
-        tags = data['tags']
+    def check_tags(self, tags):
         if not tags:
             raise serializers.ValidationError(
                 'Необходимо указать хотя бы один тег')
-        for tag in tags:
-            if not Tag.objects.filter(id=tag).exists():
-                raise serializers.ValidationError(
-                    'Такого тега не существует'
-                )
-
-        cooking_time = data['cooking_time']
-        if int(cooking_time) < MIN_VALUE:
+        tag_objects = Tag.objects.in_bulk(tags)
+        self.check_missing(tags, tag_objects, 'Таких тегов не существует')
+        return [tag_objects[tag] for tag in tags]
+
+    @staticmethod
+    def check_missing(id_list, objects, message):
+        missing = [str(pk) for pk in dict.fromkeys(id_list)
+                   if pk not in objects]
+        if missing:
             raise serializers.ValidationError(
-                'Время приготовления не может быть меньше одной минуты'
+                f'{message}: {", ".join(missing)}'
             )
 
-        return data
-
     def create_update_recipe(self, ingredients_data, recipe):
         ingredients = [
             IngredientInRecipe(
                 recipe=recipe,
-                ingredient=get_object_or_404(
-                    Ingredient, id=ingredient_data['ingredient']['id']
-                ),
+                ingredient=ingredient_data['ingredient'],
                 amount=ingredient_data['amount']
             )
             for ingredient_data in ingredients_data
@@ -207,24 +245,69 @@ class RecipeCreateUpdateSerializer(WritableNestedModelSerializer):
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients_data = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(
-            author=self.context['request'].user, **validated_data
+        author = self.context['request'].user
+        recipe = Recipe.objects.create(author=author, **validated_data)
+        User.objects.filter(id=author.id).update(
+            recipes_count=F('recipes_count') + 1
         )
         recipe.tags.set(tags)
         self.create_update_recipe(ingredients_data, recipe)
         return recipe
 
+    def update_ingredients(self, recipe, ingredients_data):
+        current = {
+            item.ingredient_id: item
+            for item in IngredientInRecipe.objects.filter(recipe=recipe)
+        }
+        incoming = {
+            ingredient_data['ingredient'].id: ingredient_data
+            for ingredient_data in ingredients_data
+        }
+        removed = [
+            item.id for ingredient_id, item in current.items()
+            if ingredient_id not in incoming
+        ]
+        created = [
+            ingredient_data for ingredient_id, ingredient_data
+            in incoming.items() if ingredient_id not in current
+        ]
+        changed = []
+        for ingredient_id, item in current.items():
+            amount = incoming.get(ingredient_id, {}).get('amount')
+            if amount is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        if not (removed or created or changed):
+            return
+        ShoppingListItem.objects.remove_recipe(recipe.id)
+        if removed:
+            IngredientInRecipe.objects.filter(id__in=removed).delete()
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        if created:
+            self.create_update_recipe(created, recipe)
+        ShoppingListItem.objects.add_recipe(recipe.id)
+
     @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients_data = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance.ingredients.clear()
+        ingredients_data = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
         super().update(instance, validated_data)
-        instance.tags.set(tags)
-        self.create_update_recipe(ingredients_data, instance)
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients_data is not None:
+            self.update_ingredients(instance, ingredients_data)
         return instance
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance], 'tags', Prefetch(
+                'ingredients',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
         return RecipesSerializer(
             instance, context={'request': self.context.get('request')}
         ).data
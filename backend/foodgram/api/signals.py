@@ -0,0 +1,113 @@
+from threading import local
+
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from users.models import User
+from .caches import (CATALOG_VERSION, INGREDIENTS_VERSION, RECIPES_VERSION,
+                     TAGS_VERSION, bump_version)
+
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+class DeletingRecipes(local):
+    """Рецепты, которые удаляются в текущем потоке"""
+
+    def __init__(self):
+        self.ids = set()
+
+
+deleting_recipes = DeletingRecipes()
+
+
+def touch_recipes(recipes):
+    """Обновляет время изменения рецептов, показывающих измененные данные"""
+    recipes.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_ingredients_version(**kwargs):
+    transaction.on_commit(lambda: bump_version(INGREDIENTS_VERSION))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(**kwargs):
+    transaction.on_commit(lambda: bump_version(TAGS_VERSION))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Ingredient)
+def bump_recipes_version(**kwargs):
+    transaction.on_commit(lambda: bump_version(RECIPES_VERSION))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_catalog_version(**kwargs):
+    transaction.on_commit(lambda: bump_version(CATALOG_VERSION))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_tag_recipes(instance, created=False, **kwargs):
+    if not created:
+        touch_recipes(Recipe.objects.filter(tags=instance))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def touch_ingredient_recipes(instance, created=False, **kwargs):
+    if not created:
+        touch_recipes(Recipe.objects.filter(ingredients__ingredient=instance))
+
+
+@receiver(pre_delete, sender=Recipe)
+def mark_deleting_recipe(instance, **kwargs):
+    deleting_recipes.ids.add(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def unmark_deleting_recipe(instance, **kwargs):
+    deleting_recipes.ids.discard(instance.pk)
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+def touch_recipe_ingredients(instance, **kwargs):
+    """Обновляет рецепт, кроме каскадного удаления вместе с ним"""
+    if instance.recipe_id in deleting_recipes.ids:
+        return
+    bump_catalog_version()
+    touch_recipes(Recipe.objects.filter(pk=instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipe_tags(instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        touch_recipes(Recipe.objects.filter(tags=instance))
+    if not action.startswith('post_'):
+        return
+    bump_catalog_version()
+    if not reverse:
+        touch_recipes(Recipe.objects.filter(pk=instance.pk))
+    elif pk_set is not None:
+        touch_recipes(Recipe.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(instance, created, update_fields, **kwargs):
+    if created or update_fields and not AUTHOR_FIELDS & set(update_fields):
+        return
+    bump_catalog_version()
+    touch_recipes(instance.recipes.all())
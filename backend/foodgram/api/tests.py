@@ -0,0 +1,540 @@
+import json
+import sys
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from threading import Event, Thread
+from unittest import skipIf, skipUnless
+from uuid import UUID
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import Prefetch
+from django.db import OperationalError, connection, transaction
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.translation import gettext_lazy
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from api.autocomplete import DEFAULT_LIMIT, MAX_LIMIT, IngredientIndex
+from api.caches import VersionedCache, bump_version
+from api.filters import RecipeFilter
+from api.management.commands.audit_indexes import SEED_PREFIX, seed
+from api.management.commands.benchmark_renderers import get_endpoints
+from api.parsers import FastJSONParser
+from api.representations import build_recipe_bodies
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import RecipeBodySerializer
+from api.views import ingredient_index, recipe_ingredient_index
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
+from users.models import Follow, User
+
+RECIPES_COUNT = 60
+PLAN_RECIPES_COUNT = 2000
+SAMPLE = {
+    'name': 'Борщ — «украинский»',
+    'text': 'Строка\u2028с разделителями\u2029строк',
+    'amount': Decimal('12.50'),
+    'created': datetime(2022, 8, 1, 12, 30, 5, 123456, tzinfo=timezone.utc),
+    'day': date(2022, 8, 1),
+    'time': time(12, 30),
+    'duration': timedelta(minutes=90),
+    'uuid': UUID('12345678-1234-5678-1234-567812345678'),
+    'lazy': gettext_lazy('Рецепт'),
+    'coverage': 1 / 3,
+    'ids': (1, 2, 3),
+    1: [None, True, False, -0.25],
+}
+
+
+class RecipeTestCase(TestCase):
+    """Рецепты с тегами, ингредиентами, избранным и подписками"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@foodgram.ru',
+                 first_name='Имя', last_name='Фамилия')
+            for i in range(5)
+        )
+        cls.tags = Tag.objects.bulk_create(
+            Tag(name=f'Тег {i}', color='#E26C2D', slug=f'tag{i}')
+            for i in range(3)
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(20)
+        )
+        cls.recipes = Recipe.objects.bulk_create(
+            Recipe(name=f'Рецепт {i}', author=cls.users[i % 5],
+                   text='Описание', image='recipes/image.png',
+                   cooking_time=10)
+            for i in range(RECIPES_COUNT)
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for i, recipe in enumerate(cls.recipes)
+            for tag in cls.tags[:1 + i % 3]
+        )
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=recipe, ingredient=ingredients[(i + k) % 20],
+                amount=k + 1
+            )
+            for i, recipe in enumerate(cls.recipes)
+            for k in range(3)
+        )
+        user = cls.users[0]
+        Favorite.objects.bulk_create(
+            Favorite(user=user, recipe=recipe) for recipe in cls.recipes[::2]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=user, recipe=recipe)
+            for recipe in cls.recipes[::3]
+        )
+        Follow.objects.bulk_create(
+            Follow(user=user, author=author) for author in cls.users[1:3]
+        )
+
+    def setUp(self):
+        cache.clear()
+        for versioned in (ingredient_index, recipe_ingredient_index):
+            versioned.clear()
+        self.anonymous = APIClient()
+        self.authorized = APIClient()
+        self.authorized.force_authenticate(self.users[0])
+
+
+class RecipeQueriesTest(RecipeTestCase):
+    """Число запросов к базе не зависит от размера страницы рецептов"""
+
+    def assert_list_queries(self, client, num):
+        for limit in (6, 50):
+            cache.clear()
+            with self.subTest(limit=limit), self.assertNumQueries(num):
+                response = client.get(f'/api/recipes/?limit={limit}')
+            self.assertEqual(len(response.json()['results']), limit)
+
+    def test_list_anonymous(self):
+        self.assert_list_queries(self.anonymous, 6)
+
+    def test_list_authorized(self):
+        self.assert_list_queries(self.authorized, 9)
+
+    def test_detail(self):
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        for client, num in ((self.anonymous, 5), (self.authorized, 8)):
+            cache.clear()
+            with self.assertNumQueries(num):
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+
+class RecipeTagsFilterTest(RecipeTestCase):
+    """Фильтр по нескольким тегам не дублирует рецепты"""
+
+    TAGS = ('tag0', 'tag1', 'tag2')
+
+    def get_distinct_ids(self, slugs):
+        return set(Recipe.objects.filter(
+            tags__slug__in=slugs
+        ).distinct().values_list('id', flat=True))
+
+    def get_all_ids(self, slugs):
+        """Идентификаторы рецептов со всех страниц выдачи и count"""
+        url = '/api/recipes/?limit=7&' + '&'.join(
+            f'tags={slug}' for slug in slugs
+        )
+        ids, count = [], None
+        while url:
+            response = self.anonymous.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            count = data['count'] if count is None else count
+            ids.extend(recipe['id'] for recipe in data['results'])
+            url = data['next']
+        return ids, count
+
+    def test_each_recipe_once(self):
+        for number in range(1, len(self.TAGS) + 1):
+            slugs = self.TAGS[:number]
+            with self.subTest(tags=slugs):
+                ids, count = self.get_all_ids(slugs)
+                expected = self.get_distinct_ids(slugs)
+                self.assertEqual(len(ids), len(set(ids)))
+                self.assertEqual(set(ids), expected)
+                self.assertEqual(count, len(expected))
+
+    def filter_by_tags(self, slugs):
+        return RecipeFilter(
+            QueryDict(mutable=True, query_string='&'.join(
+                f'tags={slug}' for slug in slugs
+            )), queryset=Recipe.objects.all()
+        ).qs
+
+    def test_no_distinct(self):
+        queryset = self.filter_by_tags(self.TAGS)
+        self.assertFalse(queryset.query.distinct)
+        self.assertEqual(
+            queryset.count(), len(self.get_distinct_ids(self.TAGS))
+        )
+
+
+@skipUnless(connection.vendor == 'postgresql', 'План запроса PostgreSQL')
+class RecipeTagsFilterPlanTest(TransactionTestCase):
+    """План фильтра по тегам на заполненной базе"""
+
+    def setUp(self):
+        cache.clear()
+        seed(PLAN_RECIPES_COUNT)
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM ANALYZE recipes_recipe_tags')
+            cursor.execute('ANALYZE recipes_recipe')
+
+    def test_semi_join_on_tag_recipe_index(self):
+        for number in range(1, 4):
+            slugs = [f'{SEED_PREFIX}-{i}' for i in range(number)]
+            with self.subTest(tags=slugs):
+                queryset = RecipeFilter(
+                    QueryDict('&'.join(f'tags={slug}' for slug in slugs)),
+                    queryset=Recipe.objects.all()
+                ).qs
+                plan = queryset.explain()
+                # С одним тегом recipe_id в подзапросе уникален,
+                # и PostgreSQL заменяет полусоединение обычным
+                if number > 1:
+                    self.assertIn('Semi Join', plan)
+                self.assertIn(
+                    'Index Only Scan using '
+                    'recipes_recipe_tags_tag_recipe_idx', plan
+                )
+                self.assertNotIn('Unique', plan)
+                self.assertNotIn('Aggregate', plan)
+                self.assertEqual(queryset.count(), Recipe.objects.filter(
+                    tags__slug__in=slugs
+                ).distinct().count())
+
+
+class RecipeBodiesTest(RecipeTestCase):
+    """build_recipe_bodies совпадает с RecipeBodySerializer байт в байт"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        salt = Ingredient.objects.bulk_create(
+            Ingredient(name='Соль', measurement_unit=unit)
+            for unit in ('щепотка', 'г', 'ч. л.')
+        )
+        untagged = Recipe.objects.create(
+            name='Без тегов и картинки', author=cls.users[1],
+            text='Описание', image='', cooking_time=5
+        )
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=untagged, ingredient=ingredient,
+                               amount=amount)
+            for amount, ingredient in enumerate(salt, 1)
+        )
+
+    def test_same_json(self):
+        recipes = Recipe.objects.select_related('author').order_by('id')
+        expected = RecipeBodySerializer(recipes.prefetch_related(
+            Prefetch(
+                'ingredients',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                )
+            ),
+            'tags',
+        ), many=True).data
+        actual = build_recipe_bodies(list(recipes))
+        self.assertEqual(len(actual), RECIPES_COUNT + 1)
+        renderer = JSONRenderer()
+        for drf, fast in zip(expected, actual):
+            with self.subTest(recipe=drf['id']):
+                self.assertEqual(renderer.render(fast), renderer.render(drf))
+        self.assertEqual(actual[-1]['tags'], [])
+        self.assertIsNone(actual[-1]['image'])
+
+
+class FastJSONTest(RecipeTestCase):
+    """FastJSONRenderer и FastJSONParser совпадают со стандартными"""
+
+    def assert_same_json(self, data):
+        expected = JSONRenderer().render(data)
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+        self.assertEqual(
+            FastJSONParser().parse(BytesIO(expected)),
+            JSONParser().parse(BytesIO(expected))
+        )
+
+    def test_sample(self):
+        self.assert_same_json(SAMPLE)
+        self.assertIn(
+            b'\\u2028', FastJSONRenderer().render(SAMPLE['text'])
+        )
+
+    def test_responses(self):
+        ingredient = Ingredient.objects.order_by('id').last()
+        for url in get_endpoints(self.recipes[-1], ingredient):
+            with self.subTest(url=url):
+                response = self.authorized.get(url)
+                self.assertEqual(response.status_code, 200)
+                data = getattr(response, 'data', None)
+                if data is None:
+                    data = json.loads(response.content)
+                self.assert_same_json(data)
+
+    @skipIf(orjson is None, 'orjson не установлен')
+    def test_non_finite_floats(self):
+        for value in (float('nan'), float('inf'), float('-inf')):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    JSONRenderer().render({'x': value})
+                self.assertEqual(
+                    FastJSONRenderer().render({'x': value}), b'{"x":null}'
+                )
+
+
+class ShoppingListTest(RecipeTestCase):
+    """Итоги списков покупок совпадают с корзинами после изменений"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        call_command('reconcile_counters', stdout=StringIO())
+        ShoppingListItem.objects.rebuild()
+
+    def assert_totals(self):
+        call_command('rebuild_shopping_lists', '--check', stdout=StringIO())
+
+    def get_totals(self, user):
+        return dict(ShoppingListItem.objects.filter(user=user).values_list(
+            'ingredient_id', 'amount'
+        ))
+
+    def test_add_and_remove(self):
+        recipe = self.recipes[1]
+        url = f'/api/recipes/{recipe.id}/shopping_cart/'
+        before = self.get_totals(self.users[0])
+        self.assertEqual(self.authorized.post(url).status_code, 201)
+        self.assert_totals()
+        self.assertEqual(self.authorized.post(url).status_code, 400)
+        self.assert_totals()
+        for _ in range(2):
+            self.assertEqual(self.authorized.delete(url).status_code, 204)
+            self.assert_totals()
+        self.assertEqual(self.get_totals(self.users[0]), before)
+
+    def test_update_ingredients(self):
+        recipe = self.recipes[0]
+        links = list(recipe.ingredients.all())
+        ingredient = Ingredient.objects.exclude(
+            id__in=[link.ingredient_id for link in links]
+        ).first()
+        before = self.get_totals(self.users[0]).get(ingredient.id, 0)
+        response = self.authorized.patch(
+            f'/api/recipes/{recipe.id}/',
+            {'ingredients': [
+                {'id': links[0].ingredient_id, 'amount': 40},
+                {'id': ingredient.id, 'amount': 7},
+            ]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_totals()
+        self.assertEqual(
+            self.get_totals(self.users[0])[ingredient.id], before + 7
+        )
+
+    def test_delete_recipe(self):
+        recipe = self.recipes[3]
+        self.assertTrue(
+            ShoppingCart.objects.filter(recipe=recipe).exists()
+        )
+        client = APIClient()
+        client.force_authenticate(recipe.author)
+        response = client.delete(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_totals()
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Блокировки PostgreSQL')
+class ShoppingListLockTest(TransactionTestCase):
+    """Рецепт нельзя добавить в корзину, пока из итогов вычитается он сам"""
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username='user', email='user@foodgram.ru'
+        )
+        self.recipe = Recipe.objects.create(
+            name='Рецепт', author=self.user, text='Описание',
+            image='recipes/image.png', cooking_time=10
+        )
+
+    def add_to_cart(self, errors):
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL lock_timeout = '200ms'")
+                ShoppingCart.objects.create_if_absent(
+                    self.user.id, self.recipe.id
+                )
+        except OperationalError as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    def test_remove_recipe_locks_recipe(self):
+        errors = []
+        with transaction.atomic():
+            ShoppingListItem.objects.remove_recipe(self.recipe.id)
+            thread = Thread(target=self.add_to_cart, args=(errors,))
+            thread.start()
+            thread.join(5)
+        self.assertEqual(len(errors), 1)
+        self.assertFalse(ShoppingCart.objects.exists())
+
+
+class RecipeSignalsTest(RecipeTestCase):
+    """Сигналы обновляют время изменения рецептов без лишних запросов"""
+
+    def delete_recipe(self, recipe):
+        callbacks = len(connection.run_on_commit)
+        with CaptureQueriesContext(connection) as context:
+            recipe.delete()
+        touches = [
+            query for query in context.captured_queries
+            if query['sql'].startswith('UPDATE "recipes_recipe"')
+        ]
+        return touches, len(connection.run_on_commit) - callbacks
+
+    def test_cascade_delete_does_not_touch_recipe(self):
+        empty = Recipe.objects.create(
+            name='Без ингредиентов', author=self.users[0], text='Описание',
+            image='recipes/image.png', cooking_time=5
+        )
+        touches, empty_callbacks = self.delete_recipe(empty)
+        self.assertEqual(touches, [])
+        touches, callbacks = self.delete_recipe(self.recipes[0])
+        self.assertEqual(touches, [])
+        self.assertEqual(callbacks, empty_callbacks)
+
+    def test_ingredient_delete_touches_recipe(self):
+        recipe = self.recipes[0]
+        updated_at = recipe.updated_at
+        recipe.ingredients.first().delete()
+        recipe.refresh_from_db()
+        self.assertGreater(recipe.updated_at, updated_at)
+
+
+class QueryParamsTest(RecipeTestCase):
+    """Числовые параметры запроса проверяются до использования"""
+
+    TOO_BIG = '99999999999999999999'
+
+    def test_ingredient_limit(self):
+        for limit, status in (('2', 200), (str(sys.maxsize), 200),
+                              (self.TOO_BIG, 400), ('²', 400), ('-1', 400)):
+            with self.subTest(limit=limit):
+                response = self.anonymous.get(
+                    '/api/ingredients/', {'name': 'ингр', 'limit': limit}
+                )
+                self.assertEqual(response.status_code, status)
+        response = self.anonymous.get(
+            '/api/ingredients/', {'name': 'ингр', 'limit': 2}
+        )
+        self.assertEqual(len(response.json()), 2)
+
+    def test_recipes_limit(self):
+        for recipes_limit, status in (('1', 200), (self.TOO_BIG, 400)):
+            with self.subTest(recipes_limit=recipes_limit):
+                response = self.authorized.get(
+                    '/api/users/subscriptions/',
+                    {'recipes_limit': recipes_limit}
+                )
+                self.assertEqual(response.status_code, status)
+
+    def test_cook_ingredient_ids(self):
+        ingredient_id = str(self.recipes[0].ingredients.first().ingredient_id)
+        for ids, status in (([ingredient_id], 200),
+                            ([ingredient_id, str(2 ** 63 - 1)], 200),
+                            ([ingredient_id, str(2 ** 63)], 400),
+                            ([self.TOO_BIG], 400), (['²'], 400)):
+            with self.subTest(ingredients=ids):
+                response = self.anonymous.get(
+                    '/api/recipes/cook/', {'ingredients': ids}
+                )
+                self.assertEqual(response.status_code, status)
+
+
+class VersionedCacheTest(SimpleTestCase):
+    """Пересборка значения после смены версии"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_rebuild(self):
+        values = iter((1, 2))
+        versioned = VersionedCache('test', lambda: next(values))
+        self.assertEqual(versioned.get(), 1)
+        self.assertEqual(versioned.get(), 1)
+        bump_version('test')
+        self.assertEqual(versioned.get(), 2)
+
+    def test_stale_value_while_rebuilding(self):
+        started, release = Event(), Event()
+        values = iter((1, 2))
+
+        def build():
+            value = next(values)
+            if value == 2:
+                started.set()
+                release.wait(5)
+            return value
+
+        versioned = VersionedCache('test', build, stale=True)
+        self.assertEqual(versioned.get(), 1)
+        bump_version('test')
+        self.assertEqual(versioned.get(), 1)
+        self.assertTrue(started.wait(5))
+        self.assertEqual(versioned.get(), 1)
+        release.set()
+        with versioned.lock:
+            pass
+        self.assertEqual(versioned.get(), 2)
+
+
+class IngredientIndexTest(SimpleTestCase):
+    """Автодополнение названий ингредиентов"""
+
+    def setUp(self):
+        names = ['Молоко', 'молоко', 'Сухое молоко', 'Мука', 'Соль']
+        names += [f'Мед {i:03d}' for i in range(150)]
+        self.index = IngredientIndex(
+            {'id': i, 'name': name, 'measurement_unit': 'г'}
+            for i, name in enumerate(names)
+        )
+
+    def search(self, query, limit=None):
+        return [
+            ingredient['name']
+            for ingredient in self.index.search(query, limit)
+        ]
+
+    def test_prefix_then_contained(self):
+        self.assertEqual(
+            self.search('МОЛ'), ['Молоко', 'молоко', 'Сухое молоко']
+        )
+
+    def test_short_query_matches_prefix_only(self):
+        self.assertEqual(self.search('мо'), ['Молоко', 'молоко'])
+        self.assertEqual(self.search('ол'), [])
+
+    def test_limits(self):
+        self.assertEqual(len(self.search('ме')), DEFAULT_LIMIT)
+        self.assertEqual(len(self.search('ме', 5)), 5)
+        self.assertEqual(len(self.search('ме', sys.maxsize)), MAX_LIMIT)
@@ -1,27 +1,121 @@
-from django.db.models import Exists, OuterRef, Subquery, Sum
-from django.http import HttpResponse
+import os
+import sys
+from hashlib import md5
+
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import (AllowAny, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 
 from foodgram.settings import LIST_SHOP
-from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                            ShoppingCart, Tag)
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, SimilarRecipe, Tag)
 from users.models import Follow, User
+from .autocomplete import IngredientIndex
+from .caches import (CATALOG_VERSION, INGREDIENTS_VERSION, POPULARITY_VERSION,
+                     RECIPES_VERSION, VersionedCache, bump_version,
+                     get_modified, get_version, tag_catalog)
+from .conditional import (bump_user_relations, conditional,
+                          get_user_validators, make_etag)
+from .exports import (SHOPPING_LIST_EXPORTS, ExportContentNegotiation,
+                      TextShoppingListExport)
 from .filters import IngredientFilter, RecipeFilter
+from .loaders import load_recipes_preview
 from .mixins import ListCreateRetrieveUpdateDeleteMixin, ListRetrieveMixin
+from .page_cache import cache_anonymous_page
 from .paginations import CustomPageNumberRagination
+from .pantry import MAX_INGREDIENT_ID, RecipeIngredientIndex
 from .permissions import IsAuthorOrReadOnly
+from .renderers import FastJSONRenderer
+from .recipe_cache import RECIPE_BODY_FORMAT, render_recipes
 from .serializers import (FollowSerializer, IngredientsSerializer,
                           RecipeCreateUpdateSerializer, RecipesMiniSerializer,
                           RecipesSerializer, TagsSerializer)
 
-CONTENT_TYPE = 'text/plain'
+CHUNK_SIZE = 2000
+
+
+def parse_id(value):
+    """Приводит идентификатор из адреса к числу или возвращает 404"""
+    try:
+        return int(value)
+    except ValueError:
+        raise NotFound
+
+
+def parse_non_negative_int(name, value, maximum=sys.maxsize):
+    """Приводит параметр запроса к целому числу от нуля до maximum
+
+    Числа больше maximum отклоняются: islice и numpy их не принимают.
+    """
+    if value.isdecimal():
+        value = int(value)
+        if value <= maximum:
+            return value
+    raise ValidationError(
+        {name: f'Значение должно быть целым числом от 0 до {maximum}'}
+    )
+
+
+def render_ingredient_catalog():
+    """Готовый JSON всего каталога ингредиентов и его ETag"""
+    content = FastJSONRenderer().render(
+        IngredientsSerializer(Ingredient.objects.all(), many=True).data
+    )
+    return content, f'"{md5(content).hexdigest()}"'
+
+
+def get_recipe_validators(request, pk):
+    """ETag и время изменения рецепта одним запросом к updated_at"""
+    updated_at = Recipe.objects.filter(pk=parse_id(pk)).values_list(
+        'updated_at', flat=True
+    ).first()
+    if updated_at is None:
+        return None
+    version, modified = get_user_validators(request)
+    updated_at = updated_at.timestamp()
+    return (
+        make_etag(RECIPE_BODY_FORMAT, updated_at, version),
+        max(updated_at, modified),
+    )
+
+
+def get_recipe_list_validators(request):
+    """ETag и время изменения списка рецептов по версии каталога"""
+    names = [CATALOG_VERSION]
+    if 'ordering' in request.query_params:
+        names.append(POPULARITY_VERSION)
+    version, modified = get_user_validators(request)
+    return (
+        make_etag(RECIPE_BODY_FORMAT, version, *map(get_version, names)),
+        max(modified, *map(get_modified, names)),
+    )
+
+
+def bump_recipe_relations(user_id):
+    """Меняет версии ответов после изменения избранного или корзины"""
+    bump_user_relations(user_id)
+    bump_version(POPULARITY_VERSION)
+
+
+ingredient_catalog = VersionedCache(
+    INGREDIENTS_VERSION, render_ingredient_catalog
+)
+ingredient_index = VersionedCache(
+    INGREDIENTS_VERSION, IngredientIndex.build, stale=True
+)
+recipe_ingredient_index = VersionedCache(
+    RECIPES_VERSION, RecipeIngredientIndex.build, stale=True
+)
 
 
 class CustomUserViewSet(UserViewSet):
@@ -29,13 +123,22 @@ class CustomUserViewSet(UserViewSet):
     http_method_names = ('get', 'post', 'delete',)
     pagination_class = CustomPageNumberRagination
 
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            return None
+        return parse_non_negative_int('recipes_limit', recipes_limit)
+
     @action(
         detail=False,
         permission_classes=(IsAuthenticated,)
     )
     def subscriptions(self, request):
+        recipes_limit = self.get_recipes_limit()
         queryset = User.objects.filter(subscribers__user=self.request.user)
-        page = self.paginate_queryset(queryset)
+        page = load_recipes_preview(
+            self.paginate_queryset(queryset), recipes_limit
+        )
         serializer = FollowSerializer(
             page, many=True, context={'request': request}
         )
@@ -47,31 +150,34 @@ class CustomUserViewSet(UserViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def subscribe(self, request, id):
-        author = get_object_or_404(User, id=id)
+        recipes_limit = self.get_recipes_limit()
+        author_id = parse_id(id)
         user = self.request.user
-        follow = Follow.objects.filter(user=user, author=author)
         if request.method == 'POST':
-            if user == author:
+            if user.id == author_id:
+                get_object_or_404(User, id=author_id)
                 return Response(
                     {'errors': 'Вы не можете подписаться на себя'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            elif follow.exists():
+            created = Follow.objects.create_if_absent(user.id, author_id)
+            author = get_object_or_404(User, id=author_id)
+            if not created:
                 return Response(
                     {'errors': 'Вы уже подписаны на данного автора'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            Follow.objects.create(
-                user=user, author=author
-            )
+            bump_user_relations(user.id)
+            load_recipes_preview([author], recipes_limit)
             serializer = FollowSerializer(author, context={'request': request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if not follow.exists():
+        if not Follow.objects.delete_if_present(user.id, author_id):
+            get_object_or_404(User, id=author_id)
             return Response(
                 {'errors': 'Вы не подписаны на данного автора'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        follow.delete()
+        bump_user_relations(user.id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -82,6 +188,13 @@ class TagViewSet(ListRetrieveMixin):
     pagination_class = None
     permission_classes = [AllowAny]
 
+    def perform_authentication(self, request):
+        """Теги общедоступны, токен проверяется только при обращении"""
+        pass
+
+    def list(self, request, *args, **kwargs):
+        return Response(tag_catalog.get())
+
 
 class IngredientViewSet(ListRetrieveMixin):
     """Вьюсет для игредиентов"""
@@ -92,6 +205,33 @@ class IngredientViewSet(ListRetrieveMixin):
     filterset_class = IngredientFilter
     permission_classes = [AllowAny]
 
+    def perform_authentication(self, request):
+        """Каталог общедоступен, токен проверяется только при обращении"""
+        pass
+
+    def get_limit(self):
+        limit = self.request.query_params.get('limit')
+        if limit is None:
+            return None
+        return parse_non_negative_int('limit', limit)
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(
+                ingredient_index.get().search(name, self.get_limit())
+            )
+        if request.accepted_media_type != FastJSONRenderer.media_type:
+            return super().list(request, *args, **kwargs)
+        content, etag = ingredient_catalog.get()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(
+                content, content_type=FastJSONRenderer.media_type
+            )
+        response['ETag'] = etag
+        return response
+
 
 class RecipeViewSet(ListCreateRetrieveUpdateDeleteMixin):
     """Вьюсет для рецептов"""
@@ -102,43 +242,96 @@ class RecipeViewSet(ListCreateRetrieveUpdateDeleteMixin):
     pagination_class = CustomPageNumberRagination
 
     def get_queryset(self):
-        return Recipe.objects.annotate(
-            is_favorited=Exists(
-                Subquery(
-                    Favorite.objects.filter(
-                        user_id=self.request.user.id, recipe__pk=OuterRef('pk')
-                    )
-                )
-            ),
-            is_in_shopping_cart=Exists(
-                Subquery(
-                    ShoppingCart.objects.filter(
-                        user_id=self.request.user.id, recipe__pk=OuterRef('pk')
-                    )
-                )
-            ),
-        )
+        return Recipe.objects.select_related('author')
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipesSerializer
         return RecipeCreateUpdateSerializer
 
+    @conditional(get_recipe_list_validators)
+    @cache_anonymous_page
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(render_recipes(page, request))
+
+    @conditional(get_recipe_validators)
+    @cache_anonymous_page
+    def retrieve(self, request, *args, **kwargs):
+        return Response(render_recipes([self.get_object()], request)[0])
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        ShoppingListItem.objects.remove_recipe(instance.id)
+        User.objects.filter(id=instance.author_id).update(
+            recipes_count=F('recipes_count') - 1
+        )
+        instance.delete()
+
+    @action(detail=False, permission_classes=[AllowAny])
+    def cook(self, request):
+        ingredient_ids = request.query_params.getlist('ingredients')
+        if not ingredient_ids:
+            raise ValidationError(
+                {'ingredients': 'Необходимо указать хотя бы один ингредиент'}
+            )
+        matches = recipe_ingredient_index.get().search([
+            parse_non_negative_int(
+                'ingredients', ingredient_id, MAX_INGREDIENT_ID
+            )
+            for ingredient_id in ingredient_ids
+        ])
+        page = self.paginate_queryset(matches)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        page = [
+            (recipes[recipe_id], coverage, missing)
+            for recipe_id, coverage, missing in page if recipe_id in recipes
+        ]
+        data = render_recipes([recipe for recipe, _, _ in page], request)
+        for recipe, (_, coverage, missing) in zip(data, page):
+            recipe['coverage'], recipe['missing'] = coverage, missing
+        return self.get_paginated_response(data)
+
+    @action(detail=True, permission_classes=[AllowAny])
+    def similar(self, request, pk):
+        recipe_id = parse_id(pk)
+        similar = [
+            item.similar for item in SimilarRecipe.objects.filter(
+                recipe_id=recipe_id
+            ).select_related('similar')
+        ]
+        if not similar:
+            get_object_or_404(Recipe, pk=recipe_id)
+        serializer = RecipesMiniSerializer(similar, many=True)
+        return Response(serializer.data)
+
     @staticmethod
+    @transaction.atomic
     def add_delete_recipe(model, pk, request):
         user = request.user
-        recipe = get_object_or_404(Recipe, pk=pk)
-        existing_object = model.objects.filter(user=user, recipe=recipe)
+        recipe_id = parse_id(pk)
         if request.method == 'POST':
-            if existing_object.exists():
+            created = model.objects.create_if_absent(user.id, recipe_id)
+            recipe = get_object_or_404(Recipe, pk=recipe_id)
+            if not created:
                 return Response(
                     {'errors': 'Рецепт уже добавлен'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            model.objects.create(user=user, recipe=recipe)
+            if model is ShoppingCart:
+                ShoppingListItem.objects.add_recipe(recipe_id, user.id)
+            transaction.on_commit(lambda: bump_recipe_relations(user.id))
             serializer = RecipesMiniSerializer(recipe)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        existing_object.delete()
+        if model.objects.delete_if_present(user.id, recipe_id):
+            if model is ShoppingCart:
+                ShoppingListItem.objects.remove_recipe(recipe_id, user.id)
+            transaction.on_commit(lambda: bump_recipe_relations(user.id))
+        else:
+            get_object_or_404(Recipe, pk=recipe_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -163,23 +356,30 @@ class RecipeViewSet(ListCreateRetrieveUpdateDeleteMixin):
 
     @action(
         permission_classes=[IsAuthenticated],
-        detail=False
+        detail=False,
+        content_negotiation_class=ExportContentNegotiation
     )
     def download_shopping_cart(self, request):
-        user = request.user
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__users_shopping_cart__user=user
-        ).values(
+        export_format = request.query_params.get(
+            'format', TextShoppingListExport.extension
+        )
+        if export_format not in SHOPPING_LIST_EXPORTS:
+            raise ValidationError({
+                'format': 'Доступные форматы: '
+                          + ', '.join(SHOPPING_LIST_EXPORTS)
+            })
+        export = SHOPPING_LIST_EXPORTS[export_format]()
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
+        ).values_list(
             'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(
-            total_amount=Sum('amount')
+            'ingredient__measurement_unit',
+            'amount'
+        ).order_by('ingredient__name', 'ingredient__measurement_unit')
+        response = StreamingHttpResponse(
+            export.stream(ingredients.iterator(chunk_size=CHUNK_SIZE)),
+            content_type=export.content_type
         )
-        shopping_cart = '\n'.join([
-            f'{ingredient["ingredient__name"]} - {ingredient["total_amount"]}'
-            f'{ingredient["ingredient__measurement_unit"]}'
-            for ingredient in ingredients
-        ])
-        response = HttpResponse(shopping_cart, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename={LIST_SHOP}'
+        filename = f'{os.path.splitext(LIST_SHOP)[0]}.{export.extension}'
+        response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
@@ -21,8 +21,9 @@ class IngredientAdmin(admin.ModelAdmin):
 
 class RecipeAdmin(admin.ModelAdmin):
     inlines = (IngredientInRecipeInline,)
-    list_display = ('name', 'author')
+    list_display = ('name', 'author', 'favorites_count', 'in_carts_count')
     list_filter = ('name', 'author', 'tags')
+    readonly_fields = ('favorites_count', 'in_carts_count')
 
 
 admin.site.register(Tag, TagAdmin)
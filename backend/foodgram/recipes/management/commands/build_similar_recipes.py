@@ -0,0 +1,103 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from scipy import sparse
+
+from recipes.models import IngredientInRecipe, Recipe, SimilarRecipe
+
+
+def build_features(recipe_ids, tag_weight):
+    """Разреженная матрица рецепт x (ингредиенты + теги)
+
+    Строки нормированы, поэтому их скалярное произведение - косинусное
+    сходство рецептов.
+    """
+    rows = {recipe_id: row for row, recipe_id in enumerate(recipe_ids)}
+    ingredients = IngredientInRecipe.objects.values_list(
+        'recipe_id', 'ingredient_id'
+    ).order_by()
+    tags = Recipe.tags.through.objects.values_list(
+        'recipe_id', 'tag_id'
+    ).order_by()
+    columns = {}
+    row_index, column_index, values = [], [], []
+    for kind, weight, links in (
+            ('ingredient', 1.0, ingredients), ('tag', tag_weight, tags)):
+        for recipe_id, feature_id in links.iterator():
+            if recipe_id not in rows:
+                continue
+            column = columns.setdefault((kind, feature_id), len(columns))
+            row_index.append(rows[recipe_id])
+            column_index.append(column)
+            values.append(weight)
+    matrix = sparse.csr_matrix(
+        (np.array(values, dtype=np.float32), (row_index, column_index)),
+        shape=(len(recipe_ids), max(len(columns), 1)),
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms).dot(matrix).tocsr()
+
+
+def top_neighbours(similarity, start, top):
+    """Лучшие top соседей для каждой строки блока матрицы сходства"""
+    for offset in range(similarity.shape[0]):
+        begin, end = similarity.indptr[offset], similarity.indptr[offset + 1]
+        columns = similarity.indices[begin:end]
+        scores = similarity.data[begin:end]
+        keep = columns != start + offset
+        columns, scores = columns[keep], scores[keep]
+        if len(scores) > top:
+            best = np.argpartition(-scores, top - 1)[:top]
+            columns, scores = columns[best], scores[best]
+        yield offset, columns, scores
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие рецепты по ингредиентам и тегам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int, default=10,
+            help='Сколько похожих рецептов сохранять для каждого'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Сколько строк матрицы сходства считать за раз'
+        )
+        parser.add_argument(
+            '--tag-weight', type=float, default=0.5,
+            help='Вес совпадения тегов относительно ингредиентов'
+        )
+
+    def handle(self, *args, **options):
+        recipe_ids = list(
+            Recipe.objects.order_by('id').values_list('id', flat=True)
+        )
+        features = build_features(recipe_ids, options['tag_weight'])
+        transposed = features.T.tocsc()
+        chunk_size = options['chunk_size']
+        created = 0
+        with transaction.atomic():
+            SimilarRecipe.objects.all().delete()
+            for start in range(0, len(recipe_ids), chunk_size):
+                similarity = features[start:start + chunk_size].dot(
+                    transposed
+                ).tocsr()
+                similarity.eliminate_zeros()
+                objects = [
+                    SimilarRecipe(
+                        recipe_id=recipe_ids[start + offset],
+                        similar_id=recipe_ids[column],
+                        score=float(score),
+                    )
+                    for offset, columns, scores in top_neighbours(
+                        similarity, start, options['top']
+                    )
+                    for column, score in zip(columns, scores)
+                ]
+                SimilarRecipe.objects.bulk_create(objects, batch_size=1000)
+                created += len(objects)
+        self.stdout.write(self.style.SUCCESS(
+            f'Сохранено похожих рецептов: {created}'
+        ))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает итоги списков покупок и сверяет их с корзинами'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить итоги, не пересобирая их'
+        )
+
+    @staticmethod
+    def find_drift():
+        expected = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total
+            in ShoppingListItem.objects.expected_totals().iterator()
+        }
+        actual = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            ).iterator()
+        }
+        return [
+            key for key in expected.keys() | actual.keys()
+            if expected.get(key) != actual.get(key)
+        ]
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            with transaction.atomic():
+                ShoppingListItem.objects.rebuild()
+        drift = self.find_drift()
+        if drift:
+            raise CommandError(
+                f'Итоги расходятся с корзинами в {len(drift)} позициях'
+            )
+        self.stdout.write(
+            self.style.SUCCESS('Итоги списков покупок совпадают с корзинами')
+        )
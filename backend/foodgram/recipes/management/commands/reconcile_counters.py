@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+COUNTERS = (
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+)
+
+
+def count_related(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счетчики пользователей и рецептов и исправляет их'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить счетчики, не исправляя их'
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for model, counter, related_model, field in COUNTERS:
+            with transaction.atomic():
+                drifted = model.objects.annotate(
+                    actual=count_related(related_model, field)
+                ).exclude(**{counter: F('actual')}).values('pk')
+                count = drifted.count()
+                if count and not options['check']:
+                    model.objects.filter(pk__in=drifted).update(
+                        **{counter: count_related(related_model, field)}
+                    )
+            if count:
+                self.stdout.write(
+                    f'{model._meta.model_name}.{counter}: '
+                    f'расхождений {count}'
+                )
+            total += count
+        if total and options['check']:
+            raise CommandError(f'Счетчики расходятся в {total} записях')
+        self.stdout.write(self.style.SUCCESS('Счетчики совпадают с данными'))
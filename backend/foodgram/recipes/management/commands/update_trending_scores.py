@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.caches import POPULARITY_VERSION, bump_version
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+SCORES_SQL = (
+    'SELECT recipe_id, SUM(weight * POWER(0.5, '
+    'EXTRACT(EPOCH FROM %s - created) / %s)) AS score FROM ('
+    'SELECT recipe_id, created, %s AS weight FROM {favorites} '
+    'WHERE created >= %s UNION ALL '
+    'SELECT recipe_id, created, %s AS weight FROM {carts} '
+    'WHERE created >= %s) AS activity GROUP BY recipe_id'
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает популярность рецептов за последнее время: '
+        'добавления в избранное и корзину с затуханием по давности'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--half-life', type=float, default=7,
+            help='Период полураспада вклада добавления, в днях'
+        )
+        parser.add_argument(
+            '--window', type=float, default=60,
+            help='Сколько последних дней активности учитывать'
+        )
+        parser.add_argument(
+            '--favorite-weight', type=float, default=1,
+            help='Вес добавления в избранное'
+        )
+        parser.add_argument(
+            '--cart-weight', type=float, default=1,
+            help='Вес добавления в корзину'
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        since = now - timedelta(days=options['window'])
+        half_life = timedelta(days=options['half_life']).total_seconds()
+        scores_sql = SCORES_SQL.format(
+            favorites=Favorite._meta.db_table,
+            carts=ShoppingCart._meta.db_table,
+        )
+        params = [
+            now, half_life,
+            options['favorite_weight'], since,
+            options['cart_weight'], since,
+        ]
+        recipes = Recipe._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {recipes} SET trending_score = scores.score '
+                f'FROM ({scores_sql}) AS scores '
+                f'WHERE {recipes}.id = scores.recipe_id '
+                f'AND {recipes}.trending_score <> scores.score',
+                params
+            )
+            updated = cursor.rowcount
+            cursor.execute(
+                f'UPDATE {recipes} SET trending_score = 0 '
+                f'WHERE trending_score <> 0 AND id NOT IN ('
+                f'SELECT recipe_id FROM ({scores_sql}) AS scores)',
+                params
+            )
+            updated += cursor.rowcount
+        if updated:
+            bump_version(POPULARITY_VERSION)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлена популярность рецептов: {updated}'
+        ))
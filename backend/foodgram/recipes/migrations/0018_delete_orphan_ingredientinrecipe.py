@@ -0,0 +1,19 @@
+# Generated by Django 3.2.14 on 2026-10-18 17:28
+
+from django.db import migrations
+
+
+def delete_orphans(apps, schema_editor):
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    IngredientInRecipe.objects.filter(recipe__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_orphans, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.14 on 2026-10-18 17:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0018_delete_orphan_ingredientinrecipe'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingredientinrecipe',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredients', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+    ]
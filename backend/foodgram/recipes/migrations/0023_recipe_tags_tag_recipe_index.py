@@ -0,0 +1,18 @@
+# Generated by Django 3.2.14 on 2026-10-18 17:48
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0022_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS recipes_recipe_tags_tag_recipe_idx '
+            'ON recipes_recipe_tags (tag_id, recipe_id);',
+            'DROP INDEX IF EXISTS recipes_recipe_tags_tag_recipe_idx;',
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.14 on 2026-10-18 17:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0023_recipe_tags_tag_recipe_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredientinrecipe',
+            index=models.Index(fields=['recipe', 'ingredient'], name='ingredient_in_recipe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['name', 'id'], name='recipe_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', 'name', 'id'], name='recipe_author_name_idx'),
+        ),
+    ]
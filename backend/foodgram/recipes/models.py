@@ -1,7 +1,12 @@
 from django.conf import settings
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connections, models, transaction
+from django.db.models import F
+from django.utils import timezone
 
 User = settings.AUTH_USER_MODEL
+SEARCH_CONFIG = 'russian'
 
 
 class Ingredient(models.Model):
@@ -19,7 +24,7 @@ class Ingredient(models.Model):
         return self.name
 
     class Meta:
-        ordering = ['name']
+        ordering = ['name', 'measurement_unit']
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         constraints = [
@@ -86,15 +91,65 @@ class Recipe(models.Model):
     tags = models.ManyToManyField(
         Tag, verbose_name='Тег рецепта'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='В корзинах'
+    )
+    trending_score = models.FloatField(
+        default=0,
+        verbose_name='Популярность за последнее время'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        db_index=True,
+        verbose_name='Дата изменения'
+    )
 
     class Meta:
         ordering = ['name']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            GinIndex(fields=('search_vector',), name='recipe_search_idx'),
+            models.Index(fields=('name', 'id'), name='recipe_name_idx'),
+            models.Index(
+                fields=('author', 'name', 'id'), name='recipe_author_name_idx'
+            ),
+            models.Index(
+                fields=('-favorites_count', 'id'), name='recipe_popular_idx'
+            ),
+            models.Index(
+                fields=('-trending_score', 'id'), name='recipe_trending_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def get_search_vector():
+        return (
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+        )
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'name', 'text'} & set(update_fields):
+            Recipe.objects.filter(pk=self.pk).update(
+                search_vector=self.get_search_vector()
+            )
+
 
 class IngredientInRecipe(models.Model):
     """Модель ингредиента указаного в рецепте"""
@@ -109,7 +164,6 @@ class IngredientInRecipe(models.Model):
         Recipe,
         on_delete=models.CASCADE,
         related_name='ingredients',
-        null=True,
         verbose_name='Рецепт'
     )
     amount = models.PositiveSmallIntegerField(
@@ -126,11 +180,69 @@ class IngredientInRecipe(models.Model):
                 name='unique_ingredient_to_recipe'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=('recipe', 'ingredient'),
+                name='ingredient_in_recipe_idx'
+            )
+        ]
 
     def __str__(self):
         return f'{self.ingredient} для {self.recipe}'
 
 
+class UserRecipeManager(models.Manager):
+    """Менеджер связей пользователя с рецептом
+
+    Вместе со связью в той же транзакции меняется счетчик рецепта
+    counter_field, который задают наследники.
+    """
+    counter_field = None
+
+    def change_counter(self, recipe_id, delta):
+        Recipe.objects.filter(id=recipe_id).update(
+            **{self.counter_field: F(self.counter_field) + delta}
+        )
+
+    def create_if_absent(self, user_id, recipe_id):
+        """Создает связь одним запросом
+
+        Возвращает False, если связь уже есть или рецепта не существует.
+        """
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {self.model._meta.db_table} '
+                    '(user_id, recipe_id, created) '
+                    f'SELECT %s, id, %s FROM {Recipe._meta.db_table} '
+                    'WHERE id = %s '
+                    'ON CONFLICT (user_id, recipe_id) DO NOTHING RETURNING id',
+                    [user_id, timezone.now(), recipe_id]
+                )
+                created = cursor.fetchone() is not None
+            if created:
+                self.change_counter(recipe_id, 1)
+        return created
+
+    def delete_if_present(self, user_id, recipe_id):
+        """Удаляет связь, возвращает False, если ее не было"""
+        with transaction.atomic(using=self.db):
+            deleted, _ = self.filter(
+                user_id=user_id, recipe_id=recipe_id
+            ).delete()
+            if deleted:
+                self.change_counter(recipe_id, -1)
+        return bool(deleted)
+
+
+class FavoriteManager(UserRecipeManager):
+    counter_field = 'favorites_count'
+
+
+class ShoppingCartManager(UserRecipeManager):
+    counter_field = 'in_carts_count'
+
+
 class Favorite(models.Model):
     """Модель добавления в избранное"""
     user = models.ForeignKey(
@@ -143,6 +255,12 @@ class Favorite(models.Model):
         verbose_name='Рецепт',
         related_name='users_favorite'
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Добавлен в избранное'
+    )
+
+    objects = FavoriteManager()
 
     class Meta:
         ordering = ['user']
@@ -171,6 +289,12 @@ class ShoppingCart(models.Model):
         verbose_name='Рецепты',
         related_name='users_shopping_cart'
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Добавлен в корзину'
+    )
+
+    objects = ShoppingCartManager()
 
     class Meta:
         ordering = ['user']
@@ -185,3 +309,160 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.recipe} в корзине {self.user}'
+
+
+class ShoppingListItemManager(models.Manager):
+    """Менеджер суммарных количеств ингредиентов в списках покупок
+
+    Методы вызываются в той же транзакции, что и изменение корзины или
+    ингредиентов рецепта. Если пользователь передан, итоги меняются только
+    у него, и вызывать их нужно после того, как связь с корзиной
+    действительно добавлена или удалена. Без пользователя итоги меняются
+    у всех, у кого рецепт лежит в корзине: add_recipe - после изменения
+    ингредиентов, remove_recipe - до изменения или удаления рецепта.
+    Во втором случае remove_recipe блокирует строку рецепта до конца
+    транзакции, чтобы рецепт нельзя было добавить в корзину между
+    вычитанием итогов и изменением рецепта.
+    """
+
+    def execute(self, sql, params):
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql.format(
+                items=self.model._meta.db_table,
+                ingredients=IngredientInRecipe._meta.db_table,
+                cart=ShoppingCart._meta.db_table,
+                recipes=Recipe._meta.db_table,
+            ), params)
+
+    @staticmethod
+    def cart_users(recipe_id, user_id):
+        if user_id is None:
+            return 'SELECT user_id FROM {cart} WHERE recipe_id = %s', [
+                recipe_id
+            ]
+        return 'SELECT %s AS user_id', [user_id]
+
+    def add_recipe(self, recipe_id, user_id=None):
+        """Добавляет ингредиенты рецепта в списки покупок"""
+        users_sql, users_params = self.cart_users(recipe_id, user_id)
+        self.execute(
+            'INSERT INTO {items} (user_id, ingredient_id, amount) '
+            'SELECT cart.user_id, ingredient.ingredient_id, ingredient.amount '
+            'FROM {ingredients} ingredient, (' + users_sql + ') cart '
+            'WHERE ingredient.recipe_id = %s '
+            'ON CONFLICT (user_id, ingredient_id) '
+            'DO UPDATE SET amount = {items}.amount + EXCLUDED.amount',
+            [*users_params, recipe_id]
+        )
+
+    def remove_recipe(self, recipe_id, user_id=None):
+        """Вычитает ингредиенты рецепта из списков покупок"""
+        if user_id is None:
+            self.execute(
+                'SELECT id FROM {recipes} WHERE id = %s FOR UPDATE',
+                [recipe_id]
+            )
+        users_sql, users_params = self.cart_users(recipe_id, user_id)
+        self.execute(
+            'DELETE FROM {items} WHERE user_id IN (' + users_sql + ') '
+            'AND EXISTS (SELECT 1 FROM {ingredients} ingredient '
+            'WHERE ingredient.recipe_id = %s '
+            'AND ingredient.ingredient_id = {items}.ingredient_id '
+            'AND ingredient.amount >= {items}.amount)',
+            [*users_params, recipe_id]
+        )
+        self.execute(
+            'UPDATE {items} SET amount = amount - ('
+            'SELECT ingredient.amount FROM {ingredients} ingredient '
+            'WHERE ingredient.recipe_id = %s '
+            'AND ingredient.ingredient_id = {items}.ingredient_id) '
+            'WHERE user_id IN (' + users_sql + ') AND ingredient_id IN ('
+            'SELECT ingredient_id FROM {ingredients} WHERE recipe_id = %s)',
+            [recipe_id, *users_params, recipe_id]
+        )
+
+    def expected_totals(self):
+        """Итоги, посчитанные заново по корзинам пользователей"""
+        return IngredientInRecipe.objects.filter(
+            recipe__users_shopping_cart__isnull=False
+        ).values_list(
+            'recipe__users_shopping_cart__user', 'ingredient'
+        ).annotate(total=models.Sum('amount')).order_by()
+
+    def rebuild(self):
+        """Пересобирает итоги всех пользователей"""
+        self.all().delete()
+        self.bulk_create([
+            self.model(user_id=user_id, ingredient_id=ingredient_id,
+                       amount=total)
+            for user_id, ingredient_id, total in self.expected_totals()
+        ], batch_size=1000)
+
+
+class ShoppingListItem(models.Model):
+    """Модель суммарного количества ингредиента в списке покупок"""
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        related_name='shopping_lists',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество'
+    )
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        ordering = ['user']
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_user_to_ingredient_in_shopping_list'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} в списке покупок {self.user}'
+
+
+class SimilarRecipe(models.Model):
+    """Модель похожего рецепта, рассчитанного по ингредиентам и тегам"""
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField(
+        verbose_name='Сходство'
+    )
+
+    class Meta:
+        ordering = ['recipe', '-score']
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_recipe_to_similar_recipe'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('recipe', '-score'), name='similar_recipe_score_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import F
 
 USER = 'user'
 ADMIN = 'admin'
@@ -42,6 +43,14 @@ class User(AbstractUser):
 
     is_staff = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество подписчиков'
+    )
 
     REQUIRED_FIELD = ['username', 'email', 'first_name', 'last_name']
 
@@ -66,6 +75,50 @@ class User(AbstractUser):
         return self.username
 
 
+class FollowManager(models.Manager):
+    """Менеджер подписок
+
+    Вместе с подпиской в той же транзакции меняется счетчик подписчиков
+    автора.
+    """
+
+    @staticmethod
+    def change_counter(author_id, delta):
+        User.objects.filter(id=author_id).update(
+            followers_count=F('followers_count') + delta
+        )
+
+    def create_if_absent(self, user_id, author_id):
+        """Создает подписку одним запросом
+
+        Возвращает False, если подписка уже есть или автора не существует.
+        """
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {self.model._meta.db_table} '
+                    '(user_id, author_id) '
+                    f'SELECT %s, id FROM {User._meta.db_table} '
+                    'WHERE id = %s '
+                    'ON CONFLICT (user_id, author_id) DO NOTHING RETURNING id',
+                    [user_id, author_id]
+                )
+                created = cursor.fetchone() is not None
+            if created:
+                self.change_counter(author_id, 1)
+        return created
+
+    def delete_if_present(self, user_id, author_id):
+        """Удаляет подписку, возвращает False, если ее не было"""
+        with transaction.atomic(using=self.db):
+            deleted, _ = self.filter(
+                user_id=user_id, author_id=author_id
+            ).delete()
+            if deleted:
+                self.change_counter(author_id, -1)
+        return bool(deleted)
+
+
 class Follow(models.Model):
     """Модель подписки на пользователя"""
     user = models.ForeignKey(
@@ -81,6 +134,8 @@ class Follow(models.Model):
         verbose_name='Автор'
     )
 
+    objects = FollowManager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['user', 'author'],